@@ -1,44 +1,81 @@
 # bot.py (corrected version)
+from monitor import startup  # первым: отсчёт времени запуска
+import argparse
 import asyncio
 import sys
 import traceback
+from datetime import datetime
 import telegram
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import pytz
-from monitor.fetcher import get_all_futures_tickers, fetch_ohlcv_bybit
-from monitor.analyzer import analyze
+import monitor.fetcher as fetcher_module
+import monitor.history as history
+import monitor.profiler as profiler
+import monitor.signals as signal_sender
+from monitor.candles import Candles, candle_dtype
+from monitor.fetcher import get_all_futures_tickers, fetch_kline_raw, configure_fetch, reset_fetch_stats, fetch_summary, close_session, clock
+from monitor.analyzer import compute_indicators, evaluate, merge_indicators
 from monitor.logger import log
+from monitor.pipeline import Pipeline, Stage
+from monitor.recorder import Recorder, ReplaySource
 from monitor.settings import load_config
+from monitor.sharding import Coordinator
 from monitor.signals import send_signal
-from monitor.handlers import start, test_telegram, handle_message, toggle_indicator
+from monitor.subscriptions import get_subscribers, group_by_timeframe
+from monitor.handlers import start, test_telegram, handle_message, toggle_indicator, profile, history_command, top_command
 
 if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-config = load_config()
+# Конфигурация читается в main(), а не при импорте: воркеры координатора (spawn) заново
+# импортируют главный модуль, и лишний load_config() писал бы в bot.log из каждого воркера
+config = None
 scheduler = AsyncIOScheduler(timezone=pytz.UTC)
-semaphore = asyncio.Semaphore(25)
 
 EXCLUDED_KEYWORDS = ["ALPHA", "WEB3", "AI", "BOT"]
 
-previous_signals = {}  # Кэш: {symbol: count_triggered}
+previous_signals = {}  # Кэш: {chat_id: {symbol: count_triggered}}
 cached_tickers = {}  # Глобальный кэш для тикеров
+coordinator = None  # Coordinator при config['workers'] > 0
+cycle_history = []  # Итоги циклов replay для сводки нагрузки: {duration, symbols, signals, alerts}
+startup_reported = False  # Отчёт о времени запуска пишется один раз, после первого цикла
+
+# Число обработчиков и размер очередей стадий; переопределяются через config['pipeline']
+PIPELINE_DEFAULTS = {
+    'fetch_workers': 25,
+    'parse_workers': 1,  # разбор синхронный и идёт в event loop - второй обработчик ничего не даёт
+    'analyze_workers': 4,
+    'notify_workers': 4,
+    'queue_size': 100,
+    'cycle_deadline': 55,
+}
 
 async def run_monitor():
+    # Без /profile - одна проверка, никакой дополнительной нагрузки
+    if profiler.session is None:
+        return await monitor_cycle()
+    await profiler.session.run(monitor_cycle)
+
+async def monitor_cycle():
     global config, cached_tickers
     config = load_config()
-    if not config.get('bot_status', False):
+    subscribers = [sub for sub in get_subscribers(config) if sub.get('bot_status', False)]
+    if not subscribers:
         log("Мониторинг отключен по конфигу.", level="warning")
         return
 
     try:
         log("Запуск мониторинга...")
+        configure_fetch(config.get('fetch'))
+        reset_fetch_stats()
+        if fetcher_module.recorder is not None:
+            fetcher_module.recorder.mark_cycle()
         start_time = asyncio.get_event_loop().time()
-        if not cached_tickers or cached_tickers.get('timestamp', 0) + 300 < asyncio.get_event_loop().time():
+        if not cached_tickers or cached_tickers.get('timestamp', 0) + 300 < clock():
             tickers = await get_all_futures_tickers()
             tickers = [t for t in tickers if not any(k in t.upper() for k in EXCLUDED_KEYWORDS)]
-            cached_tickers = {'tickers': tickers, 'timestamp': asyncio.get_event_loop().time()}
+            cached_tickers = {'tickers': tickers, 'timestamp': clock()}
             log(f"Получено {len(tickers)} тикеров для обработки (обновлён кэш)", level="info")
         else:
             tickers = cached_tickers['tickers']
@@ -49,45 +86,121 @@ async def run_monitor():
             log("Тикеры не найдены, проверка остановлена.", level="warning")
             return
 
-        total, signals = 0, 0
-
-        async def process_symbol(symbol):
-            nonlocal total, signals
-            async with semaphore:
-                await asyncio.sleep(0.1)
-                symbol_start_time = asyncio.get_event_loop().time()
-                try:
-                    log(f"Начало обработки {symbol}", level="info")
-                    df = await fetch_ohlcv_bybit(symbol, config['timeframe'])
-                    if df.empty:
-                        log(f"{symbol} - пустой DataFrame после fetch_ohlcv_bybit", level="warning")
-                        return
-                    is_signal, info = analyze(df, config, symbol=symbol)
-                    total += 1
-                    if is_signal:
-                        signals += 1
-                        count_triggered = info.get('count_triggered', 0)
-                        prev_count = previous_signals.get(symbol, 0)
-                        if symbol not in previous_signals or count_triggered > prev_count:
-                            log(f"Начало отправки сигнала для {symbol}", level="info")
-                            await send_signal(symbol, df, info, config)
-                            previous_signals[symbol] = count_triggered
-                        else:
-                            await send_confirmation(symbol, info, config, count_triggered, prev_count)
-                    else:
-                        log(f"[{symbol}] Нет сигнала. {info.get('debug', 'Нет дополнительной информации')}", level="info")
-                    symbol_end_time = asyncio.get_event_loop().time()
-                    log(f"Обработка {symbol} завершена за {symbol_end_time - symbol_start_time:.2f} сек", level="debug")
-                except Exception as e:
-                    log(f"Ошибка обработки {symbol}: {str(e)}", level="error")
-
-        tasks = [process_symbol(symbol) for symbol in tickers]
-        await asyncio.gather(*tasks)
+        # Индикаторы считаются один раз на (symbol, timeframe), правила - для каждого подписчика
+        groups = group_by_timeframe(subscribers)
+        group_indicators = {tf: merge_indicators(subs) for tf, subs in groups.items()}
+        log(f"Активных подписчиков: {len(subscribers)}, таймфреймы: {list(groups)}", level="info")
+        settings = {**PIPELINE_DEFAULTS, **config.get('pipeline', {})}
+        dtype = candle_dtype(config)
+        signals, alerts = 0, 0
+
+        # Конвейер: fetch -> parse -> analyze -> notify, между стадиями ограниченные очереди
+        async def fetch_stage(job):
+            symbol, timeframe = job
+            await asyncio.sleep(0.1)
+            log(f"Начало обработки {symbol} ({timeframe})", level="info")
+            rows = await fetch_kline_raw(symbol, timeframe)
+            return (symbol, timeframe, rows) if rows else None
+
+        async def parse_stage(item):
+            symbol, timeframe, rows = item
+            candles = Candles.from_bybit(rows, dtype=dtype)
+            if candles.empty:
+                log(f"{symbol} - нет свечей после fetch_kline_raw", level="warning")
+                return None
+            return symbol, timeframe, candles
+
+        async def analyze_stage(item):
+            symbol, timeframe, candles = item
+            # Расчёт индикаторов в отдельном потоке, чтобы не блокировать загрузку остальных символов
+            values = await asyncio.to_thread(compute_indicators, candles, group_indicators[timeframe], symbol)
+            return await evaluate_stage((symbol, timeframe, candles, values))
+
+        async def evaluate_stage(item):
+            nonlocal signals
+            symbol, timeframe, candles, values = item
+            matches = evaluate_subscribers(symbol, values, groups[timeframe])
+            signals += len(matches)
+            return (symbol, candles, values, matches) if matches else None
+
+        async def notify_stage(item):
+            nonlocal alerts
+            # Сначала await, потом +=: иначе обработчики notify перезаписывают приращения друг друга
+            sent = await notify_subscribers(*item)
+            alerts += sent
+            return item
+
+        queue_size = settings['queue_size']
+        if coordinator is not None:
+            # Режим координатора: fetch + индикаторы считают воркеры, здесь только правила и рассылка
+            analysis_stage = Stage('evaluate', evaluate_stage, 1, queue_size)
+            stages = [analysis_stage, Stage('notify', notify_stage, settings['notify_workers'], queue_size)]
+            source = coordinator.run_cycle(tickers, group_indicators, timeout=settings['cycle_deadline'], fetch_settings=config.get('fetch'), dtype=dtype)
+        else:
+            analysis_stage = Stage('analyze', analyze_stage, settings['analyze_workers'], queue_size)
+            stages = [
+                Stage('fetch', fetch_stage, settings['fetch_workers'], queue_size),
+                Stage('parse', parse_stage, settings['parse_workers'], queue_size),
+                analysis_stage,
+                Stage('notify', notify_stage, settings['notify_workers'], queue_size),
+            ]
+            source = ((symbol, timeframe) for timeframe in groups for symbol in tickers)
+        pipeline = Pipeline(stages, deadline=settings['cycle_deadline'])
+        await pipeline.run(source)
+        total = analysis_stage.processed
+
         end_time = asyncio.get_event_loop().time()
+        log(f"Конвейер: {pipeline.summary()}", level="info")
+        if coordinator is None:
+            log(f"Запросы свечей: {fetch_summary()}", level="info")
         log(f"Обработано {total} тикеров, сигналов: {signals}, время обработки: {end_time - start_time:.2f} сек", level="info")
+        # Только при replay: в обычной работе список рос бы без ограничений
+        if fetcher_module.replay_source is not None:
+            cycle_history.append({'duration': end_time - start_time, 'symbols': total, 'signals': signals, 'alerts': alerts})
+        if fetcher_module.recorder is not None:
+            fetcher_module.recorder.flush()
     except Exception as e:
         log(f"Ошибка в run_monitor: {str(e)} | Traceback: {traceback.format_exc()}", level="error")
 
+def evaluate_subscribers(symbol, values, subscribers):
+    """Проверяет правила каждого подписчика, возвращает [(sub, info), ...] со сработавшими сигналами"""
+    matches = []
+    for sub in subscribers:
+        is_signal, info = evaluate(values, sub, symbol=symbol)
+        if is_signal:
+            matches.append((sub, info))
+        else:
+            log(f"[{symbol}] Нет сигнала для {sub['chat_id']}. {info.get('debug', 'Нет дополнительной информации')}", level="info")
+    return matches
+
+async def notify_subscribers(symbol, candles, values, matches):
+    """
+    Отправляет сигнал или подтверждение каждому подписчику со сработавшим сигналом. Возвращает число сообщений.
+    values - результат compute_indicators, сохраняется в историю сигналов.
+    """
+    sent_messages = 0
+    chart_cache = {}
+    for sub, info in matches:
+        try:
+            sent = previous_signals.setdefault(sub['chat_id'], {})
+            count_triggered = info.get('count_triggered', 0)
+            prev_count = sent.get(symbol, 0)
+            if symbol not in sent or count_triggered > prev_count:
+                log(f"Начало отправки сигнала для {symbol} в {sub['chat_id']}", level="info")
+                await send_signal(symbol, candles, info, sub, chart_cache=chart_cache)
+                sent[symbol] = count_triggered
+                kind = 'signal'
+            else:
+                await send_confirmation(symbol, info, sub, count_triggered, prev_count)
+                kind = 'confirmation'
+            sent_messages += 1
+            # Replay и dry-run в историю не пишутся
+            if history.store is not None and not signal_sender.dry_run:
+                history.store.add(kind, symbol, sub['timeframe'], info, values, candles.close[-1], sub['chat_id'])
+        except Exception as e:
+            log(f"Ошибка обработки {symbol}: {str(e)}", level="error")
+    return sent_messages
+
 async def send_confirmation(symbol, info, config, count_triggered, prev_count):
     try:
         bot = telegram.Bot(token=config['telegram_token'])
@@ -106,6 +219,9 @@ async def send_confirmation(symbol, info, config, count_triggered, prev_count):
             f"{info['comment']}"
         )
 
+        if signal_sender.dry_run:
+            log(f"[dry-run] Подтверждение для {config['chat_id']}: {symbol}, сработало {count_triggered}")
+            return
         await bot.send_message(chat_id=config['chat_id'], text=html, parse_mode="HTML")
         log(f"[{symbol}] Отправлено подтверждение: {label}, сработало {count_triggered}")
     except Exception as e:
@@ -121,21 +237,105 @@ async def reload_bot(app):
     config = load_config()
     log("Бот перезапущен")
 
-async def main():
+async def scheduled_monitor():
+    """Задача планировщика; после первого цикла пишет в лог время запуска"""
+    global startup_reported
+    await run_monitor()
+    if not startup_reported:
+        startup_reported = True
+        startup.mark("первый цикл")
+        startup.report()
+        # Графики нужны только к первому сигналу: прогрев после цикла не отнимает у него CPU и GIL
+        if config.get('prewarm_charts', True):
+            startup.prewarm(['monitor.charts'])
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float('nan')
+
+async def run_replay(path, speed, latency=False):
+    """Прогоняет запись через run_monitor без Telegram и печатает итоги нагрузки"""
+    source = ReplaySource(path, speed, latency)
+    fetcher_module.replay_source = source
+    signal_sender.dry_run = True
+    started = asyncio.get_event_loop().time()
+    try:
+        while await source.advance():
+            await run_monitor()
+    finally:
+        source.close()
+    elapsed = asyncio.get_event_loop().time() - started
+    durations = [c['duration'] for c in cycle_history]
+    symbols = sum(c['symbols'] for c in cycle_history)
+    log(
+        f"Replay завершён: циклов {len(cycle_history)} за {elapsed:.2f} сек, "
+        f"символов {symbols} ({symbols / elapsed if elapsed else 0:.1f}/сек), "
+        f"сигналов {sum(c['signals'] for c in cycle_history)}, сообщений {sum(c['alerts'] for c in cycle_history)}, "
+        f"цикл p50 {percentile(durations, 0.5):.2f} / p99 {percentile(durations, 0.99):.2f} / max {max(durations, default=float('nan')):.2f} сек",
+        level="info"
+    )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Мониторинг пампов/дампов Bybit с сигналами в Telegram")
+    parser.add_argument('--record', metavar='PATH', help="записывать сырые ответы биржи в PATH (+ индекс PATH.idx)")
+    parser.add_argument('--replay', metavar='PATH', help="прогнать запись вместо Bybit, без Telegram (dry-run)")
+    parser.add_argument('--speed', type=float, default=1.0, help="скорость replay: 1 - как в записи, 0 - максимально быстро")
+    parser.add_argument('--replay-latency', action='store_true', help="при replay отдавать ответы с записанной задержкой (делённой на --speed)")
+    parser.add_argument('--dry-run', action='store_true', help="не отправлять сообщения в Telegram, только логировать")
+    return parser.parse_args()
+
+async def main(args):
+    global coordinator, config
+    startup.mark("импорты")
+    config = load_config()
+    startup.mark("конфигурация")
+    signal_sender.dry_run = args.dry_run
+    if args.replay:
+        await run_replay(args.replay, args.speed, args.replay_latency)
+        return
+    if args.record:
+        fetcher_module.recorder = Recorder(args.record)
+        log(f"Запись ответов биржи в {args.record}", level="info")
+    history.open_store(config.get('history_db', history.DB_PATH)).start()
+
+    # Запись и replay работают только в процессе бота, не в воркерах
+    if config.get('workers', 0) > 0 and not args.record:
+        coordinator = Coordinator(config['workers'], concurrency=config.get('worker_concurrency', 25))
+        coordinator.start()
+
+    # TA-Lib нужен первому циклу; графики прогреваются после него (scheduled_monitor)
+    startup.prewarm(['talib'])
+    # Первый цикл стартует сразу, параллельно с регистрацией обработчиков и подключением к Telegram.
+    # Через планировщик, а не отдельной задачей: max_instances=1 не даст следующему циклу наложиться на него.
+    # misfire_grace_time=None: синхронный запуск ниже может задержать планировщик дольше секунды по умолчанию
+    scheduler.add_job(scheduled_monitor, 'interval', seconds=60, next_run_time=datetime.now(pytz.UTC), misfire_grace_time=None)
+    scheduler.start()
+
     app = ApplicationBuilder().token(config['telegram_token']).build()
     app.add_handler(CommandHandler('start', start))
     app.add_handler(CommandHandler('test', test_telegram))
+    app.add_handler(CommandHandler('profile', profile))
+    app.add_handler(CommandHandler('history', history_command))
+    app.add_handler(CommandHandler('top', top_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_handler(CallbackQueryHandler(toggle_indicator))
-
-    scheduler.add_job(run_monitor, 'interval', seconds=60)
-    scheduler.start()
+    startup.mark("обработчики")
     log("Бот запущен. Используй /start или /test в Telegram.")
 
     await app.initialize()
     await app.start()
     await app.updater.start_polling(allowed_updates=['message', 'callback_query'])
-    await asyncio.Event().wait()  # Keep the loop running
+    startup.mark("telegram polling")
+    try:
+        await asyncio.Event().wait()  # Keep the loop running
+    finally:
+        scheduler.shutdown(wait=False)
+        if coordinator is not None:
+            coordinator.stop()
+        if fetcher_module.recorder is not None:
+            fetcher_module.recorder.close()
+        await history.store.close()
+        await close_session()
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    asyncio.run(main(parse_args()))
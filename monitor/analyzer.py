@@ -1,175 +1,250 @@
-import pandas as pd
 import numpy as np
-import talib
+from monitor.candles import Candles
 from monitor.logger import log
 
-def analyze(df, config, symbol="Unknown"):
+DEFAULT_INDICATORS = {
+    "price_change": True,
+    "rsi": True,
+    "macd": True,
+    "volume_surge": True,
+    "bollinger": True,
+    "adx": True,
+    "rsi_macd_divergence": True,
+    "candle_patterns": True,
+    "volume_pre_surge": True,
+    "ema_crossover": True,
+    "obv": True
+}
+
+def enabled_indicators(config):
+    """Словарь включённых индикаторов из конфигурации (или всех по умолчанию)"""
+    return config.get('indicators_enabled', DEFAULT_INDICATORS)
+
+def merge_indicators(configs):
+    """Объединение включённых индикаторов нескольких подписчиков: считаем всё, что нужно хоть одному"""
+    merged = {ind: False for ind in DEFAULT_INDICATORS}
+    for config in configs:
+        for ind, enabled in enabled_indicators(config).items():
+            merged[ind] = merged.get(ind, False) or enabled
+    return merged
+
+def compute_indicators(candles, indicators, symbol="Unknown"):
     """
-    Анализирует свечи и возвращает сигнал (памп/дамп) + инфо.
-    Возвращает: (bool is_signal, dict info)
+    Считает значения индикаторов один раз для пары (symbol, timeframe).
+    indicators - словарь включённых индикаторов (обычно объединение по всем подписчикам).
+    Ряды индикаторов сохраняются в candles.indicators для графика.
+    Возвращает: dict values для evaluate
     """
-    info = {}
-    if len(df) < 50:
-        info['debug'] = f"Внимание: для анализа {symbol} доступно только {len(df)} свечей (менее 50)"
-        return False, info
-    elif len(df) < 200:
-        info['debug'] = f"Внимание: для анализа {symbol} доступно {len(df)} свечей (менее 200, требуется для обычных монет)"
-
-    df = df.copy() if any(config.get('indicators_enabled', {}).values()) else df
-    df['close'] = df['close'].astype(float)
-    df['volume'] = df['volume'].astype(float)
-    df['high'] = df['high'].astype(float)
-    df['low'] = df['low'].astype(float)
-
-    indicators = config.get('indicators_enabled', {
-        "price_change": True,
-        "rsi": True,
-        "macd": True,
-        "volume_surge": True,
-        "bollinger": True,
-        "adx": True,
-        "rsi_macd_divergence": True,
-        "candle_patterns": True,
-        "volume_pre_surge": True,
-        "ema_crossover": True,
-        "obv": True
-    })
+    if not isinstance(candles, Candles):
+        candles = Candles.from_dataframe(candles)
+    values = {'count': len(candles), 'computed': set()}
+    if len(candles) < 50:
+        values['debug'] = f"Внимание: для анализа {symbol} доступно только {len(candles)} свечей (менее 50)"
+        return values
+    elif len(candles) < 200:
+        values['debug'] = f"Внимание: для анализа {symbol} доступно {len(candles)} свечей (менее 200, требуется для обычных монет)"
+
+    # TA-Lib тянет за собой pandas, поэтому импортируется при первом расчёте (или прогревом при запуске)
+    import talib
+
+    # TA-Lib работает только с float64; для float64-колонок копии не создаются
+    open_ = np.asarray(candles.open, dtype=np.float64)
+    high = np.asarray(candles.high, dtype=np.float64)
+    low = np.asarray(candles.low, dtype=np.float64)
+    close = np.asarray(candles.close, dtype=np.float64)
+    volume = np.asarray(candles.volume, dtype=np.float64)
+    series = candles.indicators
 
     # Инициализация переменных
     rsi = np.nan
     macd = np.nan
-    macd_cross = False
-    macd_bear = False
-    sma20 = np.nan
-    upper = np.nan
-    lower = np.nan
-    vol_surge = np.nan
-    adx = np.nan
-    bullish_divergence = False
-    bearish_divergence = False
-    bullish_candle = False
-    bearish_candle = False
-    volume_pre_surge = False
-    ema_cross_up = False
-    ema_cross_down = False
-    obv_trend = np.nan
-    obv_rising = False
-    obv_falling = False
+    values.update({
+        'rsi': np.nan,
+        'macd': np.nan,
+        'macd_cross': False,
+        'macd_bear': False,
+        'vol_surge': np.nan,
+        'adx': np.nan,
+        'bullish_divergence': False,
+        'bearish_divergence': False,
+        'bullish_candle': False,
+        'bearish_candle': False,
+        'volume_pre_surge': False,
+        'ema_cross_up': False,
+        'ema_cross_down': False,
+        'obv_trend': np.nan,
+        'obv_rising': False,
+        'obv_falling': False,
+        'price_change': (close[-1] - close[-2]) / close[-2] * 100 if close[-2] != 0 else 0.0,
+    })
 
     # RSI (14)
     if indicators.get('rsi', True) or indicators.get('rsi_macd_divergence', True):
         try:
-            df['rsi'] = talib.RSI(df['close'], timeperiod=14)
-            rsi = df['rsi'].iloc[-1]
+            series['rsi'] = talib.RSI(close, timeperiod=14)
+            rsi = values['rsi'] = series['rsi'][-1]
+            values['computed'].add('rsi')
         except Exception as e:
             log(f"Ошибка расчёта RSI для {symbol}: {e}", level="error")
 
     # MACD
     if indicators.get('macd', True) or indicators.get('rsi_macd_divergence', True):
         try:
-            df['macd'], df['signal'], df['macd_hist'] = talib.MACD(df['close'], fastperiod=12, slowperiod=26, signalperiod=9)
-            macd = df['macd'].iloc[-1]
-            macd_prev = df['macd'].iloc[-2]
-            signal = df['signal'].iloc[-1]
-            signal_prev = df['signal'].iloc[-2]
-            macd_cross = (macd > signal) and (macd_prev <= signal_prev)
-            macd_bear = (macd < signal) and (macd_prev >= signal_prev)
+            series['macd'], series['signal'], series['macd_hist'] = talib.MACD(close, fastperiod=12, slowperiod=26, signalperiod=9)
+            macd = values['macd'] = series['macd'][-1]
+            macd_prev = series['macd'][-2]
+            signal = series['signal'][-1]
+            signal_prev = series['signal'][-2]
+            values['macd_cross'] = (macd > signal) and (macd_prev <= signal_prev)
+            values['macd_bear'] = (macd < signal) and (macd_prev >= signal_prev)
+            values['computed'].add('macd')
         except Exception as e:
             log(f"Ошибка расчёта MACD для {symbol}: {e}", level="error")
 
     # Bollinger Bands
     if indicators.get('bollinger', True):
         try:
-            df['upper'], df['sma20'], df['lower'] = talib.BBANDS(df['close'], timeperiod=20, nbdevup=2, nbdevdn=2, matype=0)
-            sma20 = df['sma20'].iloc[-1]
-            upper = df['upper'].iloc[-1]
-            lower = df['lower'].iloc[-1]
-            info['bollinger'] = 'upper' if df['close'].iloc[-1] > upper else 'lower' if df['close'].iloc[-1] < lower else 'inside'
+            series['upper'], series['sma20'], series['lower'] = talib.BBANDS(close, timeperiod=20, nbdevup=2, nbdevdn=2, matype=0)
+            upper = series['upper'][-1]
+            lower = series['lower'][-1]
+            values['bollinger'] = 'upper' if close[-1] > upper else 'lower' if close[-1] < lower else 'inside'
+            values['computed'].add('bollinger')
         except Exception as e:
             log(f"Ошибка расчёта Bollinger Bands для {symbol}: {e}", level="error")
 
     # Volume Surge
     if indicators.get('volume_surge', True):
         try:
-            vol_avg = df['volume'].rolling(window=20).mean().iloc[-1]
-            vol_surge = df['volume'].iloc[-1] / vol_avg if vol_avg != 0 else np.nan
-            info['volume_surge'] = vol_surge
+            vol_avg = volume[-20:].mean()
+            values['vol_surge'] = volume[-1] / vol_avg if vol_avg != 0 else np.nan
+            values['computed'].add('volume_surge')
         except Exception as e:
             log(f"Ошибка расчёта Volume Surge для {symbol}: {e}", level="error")
 
     # ADX
     if indicators.get('adx', True):
         try:
-            df['adx'] = talib.ADX(df['high'], df['low'], df['close'], timeperiod=14)
-            adx = df['adx'].iloc[-1]
+            series['adx'] = talib.ADX(high, low, close, timeperiod=14)
+            values['adx'] = series['adx'][-1]
+            values['computed'].add('adx')
         except Exception as e:
             log(f"Ошибка расчёта ADX для {symbol}: {e}", level="error")
 
     # RSI-MACD Divergence
     if indicators.get('rsi_macd_divergence', True):
         try:
-            last_close = df['close'].iloc[-1]
-            prev_close = df['close'].iloc[-2]
+            last_close = close[-1]
+            prev_close = close[-2]
             last_rsi = rsi
-            prev_rsi = df['rsi'].iloc[-2]
+            prev_rsi = series['rsi'][-2]
             last_macd = macd
-            prev_macd = df['macd'].iloc[-2]
+            prev_macd = series['macd'][-2]
             bullish_divergence = (last_close < prev_close) and (last_rsi > prev_rsi) and (last_macd > prev_macd)
             bearish_divergence = (last_close > prev_close) and (last_rsi < prev_rsi) and (last_macd < prev_macd)
-            info['rsi_macd_divergence'] = 'bullish' if bullish_divergence else 'bearish' if bearish_divergence else 'none'
+            values['bullish_divergence'] = bullish_divergence
+            values['bearish_divergence'] = bearish_divergence
+            values['rsi_macd_divergence'] = 'bullish' if bullish_divergence else 'bearish' if bearish_divergence else 'none'
+            values['computed'].add('rsi_macd_divergence')
         except Exception as e:
             log(f"Ошибка расчёта дивергенции для {symbol}: {e}", level="error")
 
     # Candle Patterns
     if indicators.get('candle_patterns', True):
         try:
-            bullish_candle = talib.CDLHAMMER(df['open'], df['high'], df['low'], df['close']).iloc[-1] > 0
-            bearish_candle = talib.CDLSHOOTINGSTAR(df['open'], df['high'], df['low'], df['close']).iloc[-1] > 0
-            info['bullish_candle'] = bullish_candle
-            info['bearish_candle'] = bearish_candle
+            values['bullish_candle'] = talib.CDLHAMMER(open_, high, low, close)[-1] > 0
+            values['bearish_candle'] = talib.CDLSHOOTINGSTAR(open_, high, low, close)[-1] > 0
+            values['computed'].add('candle_patterns')
         except Exception as e:
             log(f"Ошибка расчёта свечных паттернов для {symbol}: {e}", level="error")
 
     # Volume Pre-Surge
     if indicators.get('volume_pre_surge', True):
         try:
-            vol_change = (df['volume'].iloc[-2] - df['volume'].iloc[-3]) / df['volume'].iloc[-3] if df['volume'].iloc[-3] != 0 else 0
-            volume_pre_surge = 0.2 <= vol_change <= 0.5
-            info['volume_pre_surge'] = volume_pre_surge
+            vol_change = (volume[-2] - volume[-3]) / volume[-3] if volume[-3] != 0 else 0
+            values['volume_pre_surge'] = 0.2 <= vol_change <= 0.5
+            values['computed'].add('volume_pre_surge')
         except Exception as e:
             log(f"Ошибка расчёта Volume Pre-Surge для {symbol}: {e}", level="error")
 
     # EMA Crossover
     if indicators.get('ema_crossover', True):
         try:
-            df['ema12'] = talib.EMA(df['close'], timeperiod=12)
-            df['ema26'] = talib.EMA(df['close'], timeperiod=26)
-            ema_cross_up = (df['ema12'].iloc[-1] > df['ema26'].iloc[-1]) and (df['ema12'].iloc[-2] <= df['ema26'].iloc[-2])
-            ema_cross_down = (df['ema12'].iloc[-1] < df['ema26'].iloc[-1]) and (df['ema12'].iloc[-2] >= df['ema26'].iloc[-2])
-            info['ema_cross_up'] = ema_cross_up
-            info['ema_cross_down'] = ema_cross_down
+            ema12 = talib.EMA(close, timeperiod=12)
+            ema26 = talib.EMA(close, timeperiod=26)
+            values['ema_cross_up'] = (ema12[-1] > ema26[-1]) and (ema12[-2] <= ema26[-2])
+            values['ema_cross_down'] = (ema12[-1] < ema26[-1]) and (ema12[-2] >= ema26[-2])
+            values['computed'].add('ema_crossover')
         except Exception as e:
             log(f"Ошибка расчёта EMA Crossover для {symbol}: {e}", level="error")
 
     # OBV
     if indicators.get('obv', True):
         try:
-            df['obv'] = talib.OBV(df['close'], df['volume'])
-            obv_trend = df['obv'].iloc[-1] - df['obv'].iloc[-2]
-            obv_rising = obv_trend > 0
-            obv_falling = obv_trend < 0
-            info['obv_trend'] = obv_trend
+            obv = talib.OBV(close, volume)
+            obv_trend = values['obv_trend'] = obv[-1] - obv[-2]
+            values['obv_rising'] = obv_trend > 0
+            values['obv_falling'] = obv_trend < 0
+            values['computed'].add('obv')
         except Exception as e:
             log(f"Ошибка расчёта OBV для {symbol}: {e}", level="error")
 
+    return values
+
+def evaluate(values, config, symbol="Unknown"):
+    """
+    Проверяет правила подписчика (включённые/обязательные индикаторы, пороги)
+    по уже посчитанным значениям compute_indicators. Дешёвая операция без TA-Lib.
+    Возвращает: (bool is_signal, dict info)
+    """
+    info = {}
+    if 'debug' in values:
+        info['debug'] = values['debug']
+    if values['count'] < 50:
+        return False, info
+
+    indicators = enabled_indicators(config)
+    rsi = values['rsi']
+    macd_cross = values['macd_cross']
+    macd_bear = values['macd_bear']
+    vol_surge = values['vol_surge']
+    adx = values['adx']
+    bullish_divergence = values['bullish_divergence']
+    bearish_divergence = values['bearish_divergence']
+    bullish_candle = values['bullish_candle']
+    bearish_candle = values['bearish_candle']
+    volume_pre_surge = values['volume_pre_surge']
+    ema_cross_up = values['ema_cross_up']
+    ema_cross_down = values['ema_cross_down']
+    obv_rising = values['obv_rising']
+    obv_falling = values['obv_falling']
+
+    # Поля info только для индикаторов, включённых у подписчика и успешно посчитанных
+    computed = {ind for ind in values['computed'] if indicators.get(ind, True)}
+    if 'bollinger' in computed:
+        info['bollinger'] = values['bollinger']
+    if 'volume_surge' in computed:
+        info['volume_surge'] = vol_surge
+    if 'rsi_macd_divergence' in computed:
+        info['rsi_macd_divergence'] = values['rsi_macd_divergence']
+    if 'candle_patterns' in computed:
+        info['bullish_candle'] = bullish_candle
+        info['bearish_candle'] = bearish_candle
+    if 'volume_pre_surge' in computed:
+        info['volume_pre_surge'] = volume_pre_surge
+    if 'ema_crossover' in computed:
+        info['ema_cross_up'] = ema_cross_up
+        info['ema_cross_down'] = ema_cross_down
+    if 'obv' in computed:
+        info['obv_trend'] = values['obv_trend']
+
     # Подсчёт сработавших индикаторов
     triggered = []
-    if indicators.get('rsi', True) and not pd.isna(rsi):
+    if indicators.get('rsi', True) and not np.isnan(rsi):
         if rsi > 70 or rsi < 30: triggered.append('rsi')
     if indicators.get('macd', True) and (macd_cross or macd_bear): triggered.append('macd')
-    if indicators.get('volume_surge', True) and not pd.isna(vol_surge) and vol_surge > 2: triggered.append('volume_surge')
+    if indicators.get('volume_surge', True) and not np.isnan(vol_surge) and vol_surge > 2: triggered.append('volume_surge')
     if indicators.get('bollinger', True) and info.get('bollinger') != 'inside': triggered.append('bollinger')
-    if indicators.get('adx', True) and not pd.isna(adx) and adx > 25: triggered.append('adx')
+    if indicators.get('adx', True) and not np.isnan(adx) and adx > 25: triggered.append('adx')
     if indicators.get('rsi_macd_divergence', True) and info.get('rsi_macd_divergence') != 'none': triggered.append('rsi_macd_divergence')
     if indicators.get('candle_patterns', True) and (bullish_candle or bearish_candle): triggered.append('candle_patterns')
     if indicators.get('volume_pre_surge', True) and volume_pre_surge: triggered.append('volume_pre_surge')
@@ -190,7 +265,7 @@ def analyze(df, config, symbol="Unknown"):
     # Определение типа сигнала (pump/dump)
     signal_type = ""
     if is_signal:
-        price_change = (df['close'].iloc[-1] - df['close'].iloc[-2]) / df['close'].iloc[-2] * 100
+        price_change = values['price_change']
         if price_change > config['price_change_threshold']:
             signal_type = "pump"
         elif price_change < -config['price_change_threshold']:
@@ -200,13 +275,13 @@ def analyze(df, config, symbol="Unknown"):
     # Комментарий
     comment_parts = []
     if indicators.get('rsi', True):
-        comment_parts.append(f"RSI={rsi:.1f}" if not pd.isna(rsi) else "RSI=NaN")
+        comment_parts.append(f"RSI={rsi:.1f}" if not np.isnan(rsi) else "RSI=NaN")
     if indicators.get('macd', True):
         comment_parts.append(f"MACD={'бычий' if macd_cross else 'медвежий' if macd_bear else 'нейтральный'}")
     if indicators.get('volume_surge', True):
-        comment_parts.append(f"объём x{vol_surge:.2f}" if not pd.isna(vol_surge) else "объём=NaN")
+        comment_parts.append(f"объём x{vol_surge:.2f}" if not np.isnan(vol_surge) else "объём=NaN")
     if indicators.get('adx', True):
-        comment_parts.append(f"ADX={adx:.1f}" if not pd.isna(adx) else "ADX=NaN")
+        comment_parts.append(f"ADX={adx:.1f}" if not np.isnan(adx) else "ADX=NaN")
     if indicators.get('rsi_macd_divergence', True):
         comment_parts.append(f"Дивергенция={'бычья' if bullish_divergence else 'медвежья' if bearish_divergence else 'нет'}")
     if indicators.get('candle_patterns', True):
@@ -226,4 +301,13 @@ def analyze(df, config, symbol="Unknown"):
     else:
         info['debug'] = f"Сигнал сгенерирован для {symbol}: {signal_type}, сработало {count_triggered} из {total_indicators}"
 
-    return bool(signal_type), info
\ No newline at end of file
+    return bool(signal_type), info
+
+def analyze(candles, config, symbol="Unknown"):
+    """
+    Анализирует свечи и возвращает сигнал (памп/дамп) + инфо.
+    Принимает Candles (или DataFrame OHLCV, он будет преобразован).
+    Возвращает: (bool is_signal, dict info)
+    """
+    values = compute_indicators(candles, enabled_indicators(config), symbol=symbol)
+    return evaluate(values, config, symbol=symbol)
@@ -0,0 +1,79 @@
+import numpy as np
+from monitor.logger import log
+
+OHLCV_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+# Допустимые значения config['candle_dtype']; float32 вдвое уменьшает память под свечи
+CANDLE_DTYPES = {'float64': np.float64, 'float32': np.float32}
+
+def candle_dtype(config):
+    """Тип массивов OHLCV из config['candle_dtype'] (по умолчанию float64)"""
+    name = config.get('candle_dtype', 'float64')
+    if name not in CANDLE_DTYPES:
+        log(f"Неизвестный candle_dtype {name}, используется float64", level="warning")
+        return np.float64
+    return CANDLE_DTYPES[name]
+
+
+class Candles:
+    """
+    Компактное хранилище свечей: непрерывные массивы float64 (или float32)
+    для OHLCV и int64-метки времени в миллисекундах.
+    Индикаторы, посчитанные в analyze, складываются в словарь indicators.
+    """
+    __slots__ = ('timestamp', 'open', 'high', 'low', 'close', 'volume', 'indicators')
+
+    def __init__(self, timestamp, open, high, low, close, volume):
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.indicators = {}
+
+    @classmethod
+    def empty_set(cls, dtype=np.float64):
+        """Пустой набор свечей (аналог pd.DataFrame() при ошибке загрузки)"""
+        values = np.empty(0, dtype=dtype)
+        return cls(np.empty(0, dtype=np.int64), values, values, values, values, values)
+
+    @classmethod
+    def from_bybit(cls, rows, dtype=np.float64):
+        """
+        Разбирает список Bybit [[timestamp, open, high, low, close, volume, turnover], ...]
+        (строки) сразу в массивы, без промежуточного DataFrame.
+        """
+        if not rows:
+            return cls.empty_set(dtype)
+        timestamp = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        # Один блок (5, n): каждая строка блока - непрерывная колонка OHLCV
+        block = np.array([row[1:6] for row in rows], dtype=dtype).T.copy()
+        return cls(timestamp, block[0], block[1], block[2], block[3], block[4])
+
+    @classmethod
+    def from_dataframe(cls, df, dtype=np.float64):
+        """Создаёт Candles из DataFrame с колонками OHLCV и DatetimeIndex"""
+        if df.empty:
+            return cls.empty_set(dtype)
+        timestamp = df.index.values.astype('datetime64[ms]').astype(np.int64)
+        columns = [np.ascontiguousarray(df[col].to_numpy(dtype=dtype)) for col in OHLCV_COLUMNS]
+        return cls(timestamp, *columns)
+
+    @property
+    def empty(self):
+        return len(self.timestamp) == 0
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def to_dataframe(self):
+        """
+        Строит DataFrame (OHLCV + индикаторы) с DatetimeIndex.
+        Нужен только для построения графика, поэтому pandas импортируется здесь.
+        """
+        import pandas as pd
+
+        data = {col: getattr(self, col) for col in OHLCV_COLUMNS}
+        data.update(self.indicators)
+        index = pd.DatetimeIndex(pd.to_datetime(self.timestamp, unit='ms'), name='timestamp')
+        return pd.DataFrame(data, index=index)
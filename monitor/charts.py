@@ -1,21 +1,32 @@
 import io
+import threading
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # без GUI: быстрее импорт, безопасно для потоков без дисплея
 import matplotlib.pyplot as plt
 import mplfinance as mpf
+from monitor.candles import Candles
 from monitor.logger import log
 
+# pyplot не потокобезопасен: графики рисуются по одному, даже из разных потоков
+_plot_lock = threading.Lock()
+
 def create_chart(df_plot, symbol, timeframe):
     """
     Создаёт график свечей с индикаторами и возвращает его в виде байтов.
+    Принимает Candles (DataFrame строится только здесь) или готовый DataFrame.
     """
     try:
+        if isinstance(df_plot, Candles):
+            df_plot = df_plot.to_dataframe()
+        else:
+            df_plot = df_plot.copy()
         log(f"Колонки в df_plot для {symbol}: {list(df_plot.columns)}", level="debug")
         if len(df_plot) < 2:
             log(f"Недостаточно данных для построения графика {symbol}: {len(df_plot)} свечей", level="warning")
             return None
 
-        df_plot = df_plot.copy()
         add_plots = []
 
         if all(col in df_plot for col in ['sma20', 'upper', 'lower']):
@@ -50,22 +61,23 @@ def create_chart(df_plot, symbol, timeframe):
             log(f"Нет индикаторов для отображения на графике для {symbol}", level="warning")
             return None
 
-        fig, axes = mpf.plot(
-            df_plot,
-            type='candle',
-            style='yahoo',
-            title=f"{symbol} ({timeframe})",
-            ylabel='Price (USDT)',
-            addplot=add_plots,
-            volume=True,
-            panel_ratios=(3, 1, 1, 1) if add_plots else (3, 1),
-            figsize=(12, 8),
-            returnfig=True
-        )
+        with _plot_lock:
+            fig, axes = mpf.plot(
+                df_plot,
+                type='candle',
+                style='yahoo',
+                title=f"{symbol} ({timeframe})",
+                ylabel='Price (USDT)',
+                addplot=add_plots,
+                volume=True,
+                panel_ratios=(3, 1, 1, 1) if add_plots else (3, 1),
+                figsize=(12, 8),
+                returnfig=True
+            )
 
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', bbox_inches='tight')
-        plt.close(fig)
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', bbox_inches='tight')
+            plt.close(fig)
         buf.seek(0)
         return buf
 
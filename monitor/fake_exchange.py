@@ -0,0 +1,74 @@
+"""
+Локальный фейковый Bybit для нагрузочных проверок fetcher: отдаёт /tickers и /kline
+и случайно подвешивает или роняет запросы.
+
+Запуск:
+    python -m monitor.fake_exchange --port 8081 --stall-rate 0.02 --stall-seconds 30
+    BYBIT_API=http://127.0.0.1:8081/v5/market python bot.py
+"""
+import argparse
+import asyncio
+import random
+import time
+from aiohttp import web
+
+INTERVAL_MS = {'1': 60_000, '5': 300_000, '15': 900_000, '60': 3_600_000}
+
+def make_app(symbols=300, latency=0.05, stall_rate=0.0, stall_seconds=30.0, error_rate=0.0, seed=None):
+    rng = random.Random(seed)
+    names = [f"FAKE{i}USDT" for i in range(symbols)]
+
+    async def inject():
+        """Базовая задержка + редкие зависания и ошибки"""
+        await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+        roll = rng.random()
+        if roll < stall_rate:
+            await asyncio.sleep(stall_seconds)
+        elif roll < stall_rate + error_rate:
+            raise web.HTTPServiceUnavailable(text="injected error")
+
+    async def tickers(request):
+        await inject()
+        items = [{'symbol': name, 'turnover24h': str(rng.uniform(1e6, 1e9))} for name in names]
+        return web.json_response({'retCode': 0, 'result': {'category': 'linear', 'list': items}})
+
+    async def kline(request):
+        await inject()
+        step = INTERVAL_MS.get(request.query.get('interval', '1'), 60_000)
+        limit = int(request.query.get('limit', 200))
+        symbol_rng = random.Random(request.query.get('symbol', ''))
+        now = int(time.time() * 1000) // step * step
+        price = symbol_rng.uniform(0.1, 100.0)
+        rows = []
+        for i in range(limit):
+            open_ = price
+            price = max(1e-6, price * (1 + rng.gauss(0, 0.004)))
+            high = max(open_, price) * (1 + abs(rng.gauss(0, 0.001)))
+            low = min(open_, price) * (1 - abs(rng.gauss(0, 0.001)))
+            volume = abs(rng.gauss(1000, 300))
+            rows.append([str(now - (limit - 1 - i) * step), f"{open_:.6f}", f"{high:.6f}", f"{low:.6f}", f"{price:.6f}", f"{volume:.2f}", f"{volume * price:.2f}"])
+        # Bybit отдаёт свечи от новых к старым
+        rows.reverse()
+        return web.json_response({'retCode': 0, 'result': {'symbol': request.query.get('symbol'), 'list': rows}})
+
+    app = web.Application()
+    app.router.add_get('/v5/market/tickers', tickers)
+    app.router.add_get('/v5/market/kline', kline)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Фейковый Bybit с инъекцией зависаний")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--symbols', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--stall-rate', type=float, default=0.0)
+    parser.add_argument('--stall-seconds', type=float, default=30.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    app = make_app(args.symbols, args.latency, args.stall_rate, args.stall_seconds, args.error_rate, args.seed)
+    web.run_app(app, host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
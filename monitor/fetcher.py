@@ -1,82 +1,340 @@
 # fetcher.py (полностью измененный код)
 import aiohttp
-import pandas as pd
+import numpy as np
+import os
+import random
+from collections import deque
+from monitor.candles import Candles
 from monitor.logger import log
+from monitor.recorder import record_key
 import asyncio
 
-BYBIT_API = "https://api.bybit.com/v5/market"
+# Переопределяется через переменную окружения, например для локального fake_exchange
+BYBIT_API = os.environ.get("BYBIT_API", "https://api.bybit.com/v5/market")
 
-async def get_all_futures_tickers():
-    try:
-        url = f"{BYBIT_API}/tickers?category=linear"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    log(f"Ошибка получения тикеров: HTTP {resp.status}, Ответ: {await resp.text()}", level="error")
-                    return []
-                data = await resp.json()
-                if not data or not isinstance(data, dict) or 'result' not in data or 'list' not in data['result']:
-                    log(f"Ошибка: данные тикеров не являются списком или пусты: {data}", level="error")
-                    return []
+# Таймауты, хеджирование и circuit breaker; переопределяются через config['fetch']
+FETCH_DEFAULTS = {
+    'request_timeout': 5.0,      # жёсткий дедлайн одного запроса, сек
+    'connect_timeout': 2.0,
+    'attempts': 3,
+    'backoff_base': 0.5,         # экспоненциальная пауза между попытками (с джиттером)
+    'backoff_max': 4.0,
+    'hedge': True,               # второй запрос, если первый дольше p95
+    'hedge_quantile': 0.95,
+    'hedge_min_delay': 0.2,
+    'breaker_threshold': 3,      # подряд неудач по символу до паузы
+    'breaker_cooldown': 120.0,
+    'endpoint_breaker_threshold': 20,  # подряд неудач по эндпоинту (любые символы)
+    'endpoint_breaker_cooldown': 30.0,
+}
+fetch_settings = dict(FETCH_DEFAULTS)
 
-            from monitor.settings import load_config
-            config = load_config()
-            volume_filter = config.get('volume_filter', 5_000_000.0)
-            tickers = []
-            failed_reasons = {'volume': 0, 'usdt': 0}
+_session = None
+_session_loop = None
+recorder = None  # Recorder: запись сырых ответов (bot.py --record)
+replay_source = None  # ReplaySource: ответы из записи вместо Bybit (bot.py --replay)
 
-            for item in data['result']['list']:
-                if not isinstance(item, dict):
-                    continue
-                symbol = item.get('symbol', '')
-                quote_volume = float(item.get('turnover24h', 0))  # Bybit использует 'turnover24h' для объема в USDT
+def configure_fetch(settings):
+    """Применяет настройки config['fetch'] поверх FETCH_DEFAULTS"""
+    fetch_settings.clear()
+    fetch_settings.update(FETCH_DEFAULTS)
+    fetch_settings.update(settings or {})
+
+async def get_session():
+    """Общая aiohttp-сессия (пул соединений) вместо новой сессии на каждую попытку"""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100))
+        _session_loop = loop
+    return _session
+
+def clock():
+    """Текущее время для кэшей: время записи при replay, иначе время event loop"""
+    if replay_source is not None:
+        return replay_source.clock()
+    return asyncio.get_event_loop().time()
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных запросов для оценки перцентилей"""
+
+    def __init__(self, size=500):
+        self.samples = deque(maxlen=size)
+
+    def add(self, latency):
+        self.samples.append(latency)
+
+    def quantile(self, q, min_samples=20):
+        if len(self.samples) < min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class CircuitBreaker:
+    """
+    После threshold неудач подряд ключ (символ или эндпоинт) ставится на паузу на cooldown секунд.
+    После паузы - полуоткрытое состояние: проходит один пробный запрос, остальные отклоняются,
+    пока проба не вызовет success() (ключ закрывается) или failure() (снова пауза).
+    """
+
+    def __init__(self, name, threshold, cooldown):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = {}
+        self._open_until = {}
+        self._probes = {}  # {key: время выдачи пробы}
+
+    def allow(self, key):
+        now = asyncio.get_event_loop().time()
+        probe_started = self._probes.get(key)
+        if probe_started is not None:
+            # Проба могла пропасть без результата (отмена по дедлайну цикла) - тогда выдаём новую
+            if now - probe_started < self.cooldown:
+                return False
+            self._probes[key] = now
+            return True
+        until = self._open_until.get(key)
+        if until is None:
+            return True
+        if now >= until:
+            del self._open_until[key]
+            self._probes[key] = now
+            return True
+        return False
+
+    def release(self, key):
+        """Возвращает неиспользованную пробу: запрос не был отправлен (его отклонил другой breaker)"""
+        if self._probes.pop(key, None) is not None:
+            self._open_until[key] = asyncio.get_event_loop().time()
+
+    def success(self, key):
+        self._failures.pop(key, None)
+        self._probes.pop(key, None)
+
+    def failure(self, key):
+        if self._probes.pop(key, None) is not None:
+            self._open_until[key] = asyncio.get_event_loop().time() + self.cooldown
+            fetch_stats['breaker_opened'] += 1
+            log(f"Circuit breaker {self.name}: пробный запрос {key} неудачен, снова пауза {self.cooldown:.0f} сек", level="warning")
+            return
+        count = self._failures.get(key, 0) + 1
+        self._failures[key] = count
+        if count >= self.threshold and key not in self._open_until:
+            self._open_until[key] = asyncio.get_event_loop().time() + self.cooldown
+            fetch_stats['breaker_opened'] += 1
+            log(f"Circuit breaker {self.name}: {key} на паузе {self.cooldown:.0f} сек после {count} ошибок подряд", level="warning")
+
+    def open_keys(self):
+        now = asyncio.get_event_loop().time()
+        return [key for key, until in self._open_until.items() if until > now] + list(self._probes)
 
-                if not symbol.endswith('USDT'):
-                    failed_reasons['usdt'] += 1
+kline_latency = LatencyTracker()
+symbol_breaker = CircuitBreaker('symbol', FETCH_DEFAULTS['breaker_threshold'], FETCH_DEFAULTS['breaker_cooldown'])
+endpoint_breaker = CircuitBreaker('endpoint', FETCH_DEFAULTS['endpoint_breaker_threshold'], FETCH_DEFAULTS['endpoint_breaker_cooldown'])
+fetch_stats = {}
+
+def reset_fetch_stats():
+    """Обнуляет счётчики запросов (вызывается в начале каждого цикла)"""
+    fetch_stats.update({
+        'requests': 0,
+        'timeouts': 0,
+        'errors': 0,
+        'hedges': 0,
+        'hedge_wins': 0,
+        'skipped': 0,
+        'breaker_opened': 0,
+        'latencies': [],
+    })
+    symbol_breaker.threshold = fetch_settings['breaker_threshold']
+    symbol_breaker.cooldown = fetch_settings['breaker_cooldown']
+    endpoint_breaker.threshold = fetch_settings['endpoint_breaker_threshold']
+    endpoint_breaker.cooldown = fetch_settings['endpoint_breaker_cooldown']
+
+reset_fetch_stats()
+
+def fetch_summary():
+    """Строка для лога: перцентили задержек, хеджи, таймауты и паузы breaker"""
+    latencies = sorted(fetch_stats['latencies'])
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else float('nan')
+
+    return (
+        f"запросов {fetch_stats['requests']}, p50 {pct(0.5):.2f} / p95 {pct(0.95):.2f} / p99 {pct(0.99):.2f} сек, "
+        f"таймаутов {fetch_stats['timeouts']}, ошибок {fetch_stats['errors']}, "
+        f"хеджей {fetch_stats['hedges']} (выиграли {fetch_stats['hedge_wins']}), "
+        f"пропущено breaker {fetch_stats['skipped']}, на паузе: {symbol_breaker.open_keys() + endpoint_breaker.open_keys()}"
+    )
+
+async def _request_json(url, params, kind):
+    """
+    Один запрос с жёстким дедлайном. Возвращает (status, data или текст ответа).
+    kind ('tickers'/'kline') - тип ответа для записи и replay.
+    """
+    fetch_stats['requests'] += 1
+    if replay_source is not None:
+        return await replay_source.response(kind, params)
+    session = await get_session()
+    timeout = aiohttp.ClientTimeout(total=fetch_settings['request_timeout'], connect=fetch_settings['connect_timeout'])
+    started = asyncio.get_event_loop().time()
+
+    def record(status, body):
+        # Пишутся все исходы, кроме отмены (проигравший хедж, дедлайн цикла) - её решает бот, а не биржа
+        if recorder is not None:
+            latency = asyncio.get_event_loop().time() - started
+            recorder.record(kind, record_key(kind, params), body, status=status, latency=latency)
+
+    try:
+        async with session.get(url, params=params, timeout=timeout) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                record(resp.status, text)
+                return resp.status, text
+            data = await resp.json()
+            record(resp.status, data)
+            return resp.status, data
+    except asyncio.TimeoutError:
+        record('timeout', None)
+        raise
+    except aiohttp.ClientError as e:
+        record('error', str(e))
+        raise
+
+async def _hedged_request(url, params):
+    """
+    Запрос с хеджированием: если ответ не пришёл за p95 задержки, отправляется второй такой же,
+    берётся первый успешный (HTTP 200). Если успешных нет - последний ответ с ошибкой или исключение.
+    Возвращает (status, data).
+    """
+    loop = asyncio.get_event_loop()
+    started = loop.time()
+    primary = asyncio.ensure_future(_request_json(url, params, 'kline'))
+    tasks = {primary}
+    hedge_delay = kline_latency.quantile(fetch_settings['hedge_quantile']) if fetch_settings['hedge'] else None
+    try:
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=max(hedge_delay, fetch_settings['hedge_min_delay']))
+            if not done:
+                fetch_stats['hedges'] += 1
+                tasks.add(asyncio.ensure_future(_request_json(url, params, 'kline')))
+        error = None
+        failed = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
                     continue
-                if quote_volume < volume_filter:
-                    failed_reasons['volume'] += 1
+                if task.result()[0] != 200:
+                    # 429/503 не выигрывают гонку: ждём второй запрос и не портим p95 быстрыми ошибками
+                    failed = task.result()
                     continue
+                if task is not primary:
+                    fetch_stats['hedge_wins'] += 1
+                latency = loop.time() - started
+                kline_latency.add(latency)
+                fetch_stats['latencies'].append(latency)
+                return task.result()
+        if failed is not None:
+            return failed
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def get_all_futures_tickers():
+    try:
+        url = f"{BYBIT_API}/tickers"
+        status, data = await _request_json(url, {"category": "linear"}, 'tickers')
+        if status != 200:
+            log(f"Ошибка получения тикеров: HTTP {status}, Ответ: {data}", level="error")
+            return []
+        if not data or not isinstance(data, dict) or 'result' not in data or 'list' not in data['result']:
+            log(f"Ошибка: данные тикеров не являются списком или пусты: {data}", level="error")
+            return []
+
+        from monitor.settings import load_config
+        config = load_config()
+        volume_filter = config.get('volume_filter', 5_000_000.0)
+        tickers = []
+        failed_reasons = {'volume': 0, 'usdt': 0}
 
-                tickers.append(symbol)
+        for item in data['result']['list']:
+            if not isinstance(item, dict):
+                continue
+            symbol = item.get('symbol', '')
+            quote_volume = float(item.get('turnover24h', 0))  # Bybit использует 'turnover24h' для объема в USDT
 
-            log(f"Всего тикеров: {len(data['result']['list'])}, после фильтра по объёму ({volume_filter}): {len(tickers)}")
-            log(f"Причины исключения тикеров: {failed_reasons}", level="info")
-            return tickers
+            if not symbol.endswith('USDT'):
+                failed_reasons['usdt'] += 1
+                continue
+            if quote_volume < volume_filter:
+                failed_reasons['volume'] += 1
+                continue
+
+            tickers.append(symbol)
+
+        log(f"Всего тикеров: {len(data['result']['list'])}, после фильтра по объёму ({volume_filter}): {len(tickers)}")
+        log(f"Причины исключения тикеров: {failed_reasons}", level="info")
+        return tickers
     except Exception as e:
         log(f"Ошибка получения тикеров: {str(e)}", level="error")
         return []
 
-async def fetch_ohlcv_bybit(symbol, timeframe='1m', limit=200):
+async def fetch_kline_raw(symbol, timeframe='1m', limit=200):
+    """Загружает свечи Bybit без разбора: список строк [[timestamp, open, ...], ...] или [] при ошибке"""
     interval_map = {'1m': '1', '5m': '5', '15m': '15', '1h': '60'}  # Bybit интервалы: 1, 5, 15, 60 и т.д.
     interval = interval_map.get(timeframe, '1')
     url = f"{BYBIT_API}/kline"
     params = {"category": "linear", "symbol": symbol, "interval": interval, "limit": limit}
+    attempts = fetch_settings['attempts']
 
-    for attempt in range(3):
+    for attempt in range(attempts):
+        if not endpoint_breaker.allow('kline'):
+            fetch_stats['skipped'] += 1
+            return []
+        if not symbol_breaker.allow(symbol):
+            endpoint_breaker.release('kline')
+            fetch_stats['skipped'] += 1
+            return []
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as resp:
-                    if resp.status != 200:
-                        response_text = await resp.text()
-                        log(f"Попытка {attempt+1}: Ошибка получения OHLCV для {symbol}: HTTP {resp.status}, Ответ: {response_text}", level="error")
-                        if attempt == 2:
-                            return pd.DataFrame()
-                        await asyncio.sleep(1)
-                        continue
-                    data = await resp.json()
-                    if not data or 'result' not in data or not data['result']['list']:
-                        log(f"{symbol} - данные OHLCV пусты. HTTP {resp.status}", level="warning")
-                        return pd.DataFrame()
-                    # Bybit данные: [[timestamp, open, high, low, close, volume, turnover], ...]
-                    df = pd.DataFrame(data['result']['list'], columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'turnover'])
-                    df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
-                    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-                    df.set_index('timestamp', inplace=True)
-                    df[['open', 'high', 'low', 'close', 'volume']] = df[['open', 'high', 'low', 'close', 'volume']].astype(float)
-                    return df
+            status, data = await _hedged_request(url, params)
+            if status != 200:
+                fetch_stats['errors'] += 1
+                log(f"Попытка {attempt+1}: Ошибка получения OHLCV для {symbol}: HTTP {status}, Ответ: {data}", level="error")
+                symbol_breaker.failure(symbol)
+                endpoint_breaker.failure('kline')
+            else:
+                symbol_breaker.success(symbol)
+                endpoint_breaker.success('kline')
+                if not data or 'result' not in data or not data['result']['list']:
+                    log(f"{symbol} - данные OHLCV пусты. HTTP {status}", level="warning")
+                    return []
+                # Bybit данные: [[timestamp, open, high, low, close, volume, turnover], ...]
+                return data['result']['list']
+        except asyncio.TimeoutError:
+            fetch_stats['timeouts'] += 1
+            log(f"Попытка {attempt+1}: Таймаут {fetch_settings['request_timeout']} сек при получении OHLCV для {symbol}", level="error")
+            symbol_breaker.failure(symbol)
+            endpoint_breaker.failure('kline')
         except Exception as e:
+            fetch_stats['errors'] += 1
             log(f"Попытка {attempt+1}: Ошибка получения OHLCV для {symbol}: {str(e)}", level="error")
-            if attempt == 2:
-                return pd.DataFrame()
-            await asyncio.sleep(1)
+            symbol_breaker.failure(symbol)
+            endpoint_breaker.failure('kline')
+        if attempt < attempts - 1:
+            delay = min(fetch_settings['backoff_max'], fetch_settings['backoff_base'] * 2 ** attempt)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+    return []
+
+async def fetch_ohlcv_bybit(symbol, timeframe='1m', limit=200, dtype=np.float64):
+    """Загружает и сразу разбирает свечи в Candles (пустой Candles при ошибке)"""
+    rows = await fetch_kline_raw(symbol, timeframe, limit)
+    return Candles.from_bybit(rows, dtype=dtype)
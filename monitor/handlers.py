@@ -1,6 +1,11 @@
+import time
+from datetime import datetime, timezone
 from telegram import Update, KeyboardButton, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+import monitor.history as history
+import monitor.profiler as profiler
 from monitor.logger import log
 from monitor.settings import load_config, save_config, parse_human_number, human_readable_number
+from monitor.subscriptions import subscriber_config, update_subscriber, update_subscriber_many, is_main_chat, is_admin, is_registered
 
 def update_config(key, value):
     """Обновляет конфигурацию и сохраняет её в файл."""
@@ -10,12 +15,30 @@ def update_config(key, value):
     log(f"Конфигурация обновлена: {key} = {value}", level="info")
     return config
 
-async def start(update: Update, context):
+def chat_config(update: Update):
+    """Настройки подписчика для чата, из которого пришло обновление"""
+    return subscriber_config(load_config(), update.effective_chat.id)
+
+def can_change_settings(update: Update):
+    """
+    Настройки меняют только зарегистрированные чаты. Новый чат подключает администратор
+    (config['admin_ids']) - первое изменение настроек от него создаёт подписчика.
+    """
     config = load_config()
+    if is_registered(config, update.effective_chat.id) or is_admin(config, update.effective_user.id):
+        return True
+    log(f"Отказ в изменении настроек: чат {update.effective_chat.id}, пользователь {update.effective_user.id}", level="warning")
+    return False
+
+async def start(update: Update, context):
+    config = chat_config(update)
+    main_chat = is_main_chat(load_config(), update.effective_chat.id)
     buttons = [
         [KeyboardButton("📴 Выключить бота"), KeyboardButton("📡 Включить бота")],
         [KeyboardButton("📊 Изменить таймфрейм"), KeyboardButton("📈 Изменить порог цены")],
-        [KeyboardButton("💹 Изменить фильтр объёма"), KeyboardButton("🛠️ Сбросить настройки")],
+        # Фильтр объёма общий для всех подписчиков - кнопка только у основного чата
+        [KeyboardButton("💹 Изменить фильтр объёма"), KeyboardButton("🛠️ Сбросить настройки")] if main_chat
+        else [KeyboardButton("🛠️ Сбросить настройки")],
         [KeyboardButton("⚙️ Управление индикаторами"), KeyboardButton("🔑 Управление обязательными")],
         [KeyboardButton("📏 Мин. индикаторов")]
     ]
@@ -37,8 +60,77 @@ async def start(update: Update, context):
 async def test_telegram(update: Update, context):
     await update.message.reply_text("✅ Тест: Бот работает!")
 
-async def indicators(update: Update, context):
+async def profile(update: Update, context):
+    """/profile [N] - профилировать следующие N циклов мониторинга (только для config['admin_ids'])"""
     config = load_config()
+    if not is_admin(config, update.effective_user.id):
+        log(f"Отказ в /profile для пользователя {update.effective_user.id}", level="warning")
+        await update.message.reply_text("⛔ Команда доступна только администраторам")
+        return
+    try:
+        cycles = int(context.args[0]) if context.args else 1
+        if not 1 <= cycles <= 10:
+            raise ValueError
+    except ValueError:
+        await update.message.reply_text("Использование: /profile [N], N от 1 до 10")
+        return
+    if not profiler.request(cycles, update.effective_chat.id, config['telegram_token']):
+        await update.message.reply_text("Профилирование уже идёт, дождитесь отчёта")
+        return
+    await update.message.reply_text(f"🔬 Профилирую следующие {cycles} цикл(а/ов), отчёт придёт сюда")
+
+SIGNAL_ICONS = {'pump': "🚀", 'dump': "📉"}
+
+async def history_command(update: Update, context):
+    """/history <монета> - последние сигналы и подтверждения по монете в этом чате"""
+    if not context.args:
+        await update.message.reply_text("Использование: /history <монета>, например /history BTCUSDT")
+        return
+    if history.store is None:
+        await update.message.reply_text("История сигналов недоступна")
+        return
+    symbol = context.args[0].upper()
+    if not symbol.endswith('USDT'):
+        symbol += 'USDT'
+    started = time.perf_counter()
+    rows = await history.store.history(update.effective_chat.id, symbol)
+    elapsed = (time.perf_counter() - started) * 1000
+    if not rows:
+        await update.message.reply_text(f"По {symbol} сигналов не было")
+        return
+    lines = [f"📜 История {symbol} (последние {len(rows)}):"]
+    for ts, timeframe, kind, signal_type, count_triggered, total, price in rows:
+        moment = datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime('%d.%m %H:%M')
+        label = "подтверждение" if kind == 'confirmation' else "сигнал"
+        lines.append(f"{moment} {SIGNAL_ICONS.get(signal_type, '⚪')} {label} {timeframe}, {count_triggered}/{total}, цена {price:g}")
+    lines.append(f"⏱ {elapsed:.1f} мс")
+    await update.message.reply_text("\n".join(lines))
+
+async def top_command(update: Update, context):
+    """/top [период] - монеты с наибольшим числом сигналов в этом чате за период (30m, 12h, 7d; по умолчанию 24h)"""
+    period = context.args[0] if context.args else '24h'
+    try:
+        seconds = history.parse_period(period)
+    except ValueError as e:
+        await update.message.reply_text(str(e))
+        return
+    if history.store is None:
+        await update.message.reply_text("История сигналов недоступна")
+        return
+    started = time.perf_counter()
+    rows = await history.store.top(update.effective_chat.id, seconds)
+    elapsed = (time.perf_counter() - started) * 1000
+    if not rows:
+        await update.message.reply_text(f"За {period} сигналов не было")
+        return
+    lines = [f"🏆 Топ монет за {period}:"]
+    for place, (symbol, total, pumps, dumps) in enumerate(rows, 1):
+        lines.append(f"{place}. {symbol} - {total} (🚀 {pumps} / 📉 {dumps})")
+    lines.append(f"⏱ {elapsed:.1f} мс")
+    await update.message.reply_text("\n".join(lines))
+
+async def indicators(update: Update, context):
+    config = chat_config(update)
     keyboard = []
     for ind, enabled in config['indicators_enabled'].items():
         status = "✅" if enabled else "❌"
@@ -47,7 +139,7 @@ async def indicators(update: Update, context):
     await update.message.reply_text("Управление индикаторами:", reply_markup=reply_markup)
 
 async def required_indicators(update: Update, context):
-    config = load_config()
+    config = chat_config(update)
     keyboard = []
     for ind in config['indicators_enabled']:
         status = "🔑" if ind in config['required_indicators'] else ""
@@ -58,11 +150,15 @@ async def required_indicators(update: Update, context):
 async def toggle_indicator(update: Update, context):
     query = update.callback_query
     data = query.data
-    config = load_config()
+    chat_id = update.effective_chat.id
+    if not can_change_settings(update):
+        await query.answer("⛔ Чат не подключён, обратитесь к администратору")
+        return
+    config = chat_config(update)
     if data.startswith("toggle_"):
         ind = data.replace("toggle_", "")
         config['indicators_enabled'][ind] = not config['indicators_enabled'].get(ind, False)
-        save_config(config)
+        update_subscriber(chat_id, 'indicators_enabled', config['indicators_enabled'])
         await query.answer(f"Индикатор {ind} {'включён' if config['indicators_enabled'][ind] else 'выключен'}")
     elif data.startswith("required_"):
         ind = data.replace("required_", "")
@@ -71,19 +167,25 @@ async def toggle_indicator(update: Update, context):
             required.remove(ind)
         else:
             required.append(ind)
-        save_config(config)
+        update_subscriber(chat_id, 'required_indicators', required)
         await query.answer(f"Индикатор {ind} {'теперь обязателен' if ind in required else 'не обязателен'}")
     await query.edit_message_text(text="Обновлено!")
 
 async def handle_message(update: Update, context):
     text = update.message.text
-    if 'awaiting' in context.user_data:
-        key = context.user_data['awaiting']
+    chat_id = update.effective_chat.id
+    if not can_change_settings(update):
+        await update.message.reply_text("⛔ Чат не подключён к рассылке, обратитесь к администратору")
+        return
+    # Ожидаемый ввод хранится в chat_data: user_data общий для всех чатов пользователя,
+    # и значение, введённое в другом чате, изменило бы настройки не того подписчика
+    if 'awaiting' in context.chat_data:
+        key = context.chat_data['awaiting']
         try:
             if key == 'timeframe':
                 if text not in ['1m', '5m', '15m', '1h']:
                     raise ValueError("Таймфрейм должен быть 1m, 5m, 15m или 1h")
-                update_config('timeframe', text)
+                update_subscriber(chat_id, 'timeframe', text)
             elif key == 'volume_filter':
                 value = parse_human_number(text)
                 update_config('volume_filter', value)
@@ -91,28 +193,27 @@ async def handle_message(update: Update, context):
                 value = float(text)
                 if value < 0:
                     raise ValueError("Порог цены должен быть положительным")
-                update_config('price_change_threshold', value)
+                update_subscriber(chat_id, 'price_change_threshold', value)
             elif key == 'min_indicators':
                 value = int(text)
                 if value < 1:
                     raise ValueError("Минимальное количество индикаторов должно быть >= 1")
-                update_config('min_indicators', value)
+                update_subscriber(chat_id, 'min_indicators', value)
             await update.message.reply_text(f"{key} обновлено: {text}")
-            context.user_data.pop('awaiting')
+            context.chat_data.pop('awaiting')
         except ValueError as e:
             await update.message.reply_text(f"Ошибка: {str(e)}")
         return
 
     if text == "📴 Выключить бота":
-        update_config('bot_status', False)
+        update_subscriber(chat_id, 'bot_status', False)
         await update.message.reply_text("📴 Бот выключен")
     elif text == "📡 Включить бота":
-        update_config('bot_status', True)
+        update_subscriber(chat_id, 'bot_status', True)
         await update.message.reply_text("📡 Бот включен")
     elif text == "🛠️ Сбросить настройки":
         default_config = {
             'timeframe': '1m',
-            'volume_filter': 5000000.0,
             'price_change_threshold': 0.5,
             'bot_status': True,
             'indicators_enabled': {
@@ -131,21 +232,27 @@ async def handle_message(update: Update, context):
             'min_indicators': 1,
             'required_indicators': []
         }
-        save_config(default_config)
+        update_subscriber_many(chat_id, default_config)
+        # Фильтр объёма общий для всех подписчиков, его сбрасывает только основной чат
+        if is_main_chat(load_config(), chat_id):
+            update_config('volume_filter', 5000000.0)
         await update.message.reply_text("🛠️ Настройки сброшены")
     elif text == "📊 Изменить таймфрейм":
-        context.user_data['awaiting'] = 'timeframe'
+        context.chat_data['awaiting'] = 'timeframe'
         await update.message.reply_text("Введите таймфрейм (1m, 5m, 15m, 1h):")
     elif text == "💹 Изменить фильтр объёма":
-        context.user_data['awaiting'] = 'volume_filter'
+        if not is_main_chat(load_config(), chat_id):
+            await update.message.reply_text("⛔ Фильтр объёма общий, его меняет только основной чат")
+            return
+        context.chat_data['awaiting'] = 'volume_filter'
         await update.message.reply_text("Введите минимальный объём (например, 5M, 100K):")
     elif text == "📈 Изменить порог цены":
-        context.user_data['awaiting'] = 'price_change_threshold'
+        context.chat_data['awaiting'] = 'price_change_threshold'
         await update.message.reply_text("Введите порог изменения цены в % (например, 0.5):")
     elif text == "⚙️ Управление индикаторами":
         await indicators(update, context)
     elif text == "🔑 Управление обязательными":
         await required_indicators(update, context)
     elif text == "📏 Мин. индикаторов":
-        context.user_data['awaiting'] = 'min_indicators'
+        context.chat_data['awaiting'] = 'min_indicators'
         await update.message.reply_text("Введите минимальное количество индикаторов (целое число, от 1):")
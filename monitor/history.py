@@ -0,0 +1,166 @@
+import asyncio
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+from monitor.logger import log
+
+DB_PATH = "signals.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    type TEXT NOT NULL,
+    count_triggered INTEGER NOT NULL,
+    total_indicators INTEGER NOT NULL,
+    price REAL,
+    chat_id TEXT,
+    indicators TEXT
+);
+-- Запросы всегда в рамках одного чата: каждый видит только свои сигналы
+CREATE INDEX IF NOT EXISTS idx_signals_chat_symbol_ts ON signals(chat_id, symbol, ts);
+-- Покрывает /top: подсчёт сигналов за период без чтения самой таблицы
+CREATE INDEX IF NOT EXISTS idx_signals_chat_kind_ts ON signals(chat_id, kind, ts, symbol, type);
+"""
+
+# Служебные поля результата compute_indicators, не являющиеся значениями индикаторов
+_VALUES_SKIP = {'computed', 'debug'}
+
+store = None  # SignalHistory, открывается в bot.py
+
+def _plain(value):
+    """numpy-скаляры (np.float64, np.bool_) из compute_indicators -> JSON; NaN -> null"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+def parse_period(text):
+    """Период вида 30m, 12h, 7d в секундах"""
+    match = re.fullmatch(r'\s*(\d+)\s*([mhd])\s*', text.lower())
+    if not match:
+        raise ValueError("Неверный период. Используйте формат 30m, 12h, 7d")
+    value, unit = int(match.group(1)), match.group(2)
+    return value * {'m': 60, 'h': 3600, 'd': 86400}[unit]
+
+class SignalHistory:
+    """
+    Хранилище сигналов и подтверждений в SQLite: одна строка на отправленное в чат сообщение.
+    add() только кладёт запись в буфер; вставка пачками выполняется в отдельном потоке
+    раз в flush_interval секунд или при наборе batch_size записей.
+    """
+
+    def __init__(self, path=DB_PATH, batch_size=200, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._flusher = None
+        self._flushing = None
+
+    def add(self, kind, symbol, timeframe, info, values, price, chat_id, ts=None):
+        """kind - 'signal' или 'confirmation', info - результат evaluate, values - compute_indicators"""
+        indicators = {k: _plain(v) for k, v in values.items() if k not in _VALUES_SKIP}
+        self._buffer.append((
+            int((time.time() if ts is None else ts) * 1000),
+            symbol,
+            timeframe,
+            kind,
+            info.get('type', ''),
+            int(info.get('count_triggered', 0)),
+            int(info.get('total_indicators', 0)),
+            float(price) if price is not None else None,
+            str(chat_id),
+            json.dumps(indicators, ensure_ascii=False),
+        ))
+        if len(self._buffer) >= self.batch_size and self._flushing is None:
+            try:
+                self._flushing = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                self._insert(self._take())
+
+    def _take(self):
+        batch, self._buffer = self._buffer, []
+        return batch
+
+    def _insert(self, batch):
+        if not batch:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO signals (ts, symbol, timeframe, kind, type, count_triggered, total_indicators, price, chat_id, indicators) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+
+    async def flush(self):
+        try:
+            batch = self._take()
+            if batch:
+                await asyncio.to_thread(self._insert, batch)
+        except Exception as e:
+            log(f"Ошибка записи истории сигналов: {e}", level="error")
+        finally:
+            self._flushing = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        self._flusher = asyncio.get_running_loop().create_task(self._run())
+        log(f"История сигналов: {self.path}", level="info")
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def history(self, chat_id, symbol, limit=10):
+        """Последние записи чата по монете: [(ts, timeframe, kind, type, count_triggered, total_indicators, price), ...]"""
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT ts, timeframe, kind, type, count_triggered, total_indicators, price FROM signals "
+            "WHERE chat_id = ? AND symbol = ? ORDER BY ts DESC LIMIT ?",
+            (str(chat_id), symbol, limit),
+        )
+
+    async def top(self, chat_id, period_seconds, limit=10):
+        """
+        Монеты с наибольшим числом сигналов в чате за период: [(symbol, total, pumps, dumps), ...].
+        Подтверждения не считаются - это повторы уже отправленного сигнала.
+        """
+        since = int((time.time() - period_seconds) * 1000)
+        return await asyncio.to_thread(
+            self._query,
+            # Без подсказки планировщик выбирает (chat_id, symbol, ts) ради GROUP BY и читает все сигналы чата
+            "SELECT symbol, COUNT(*) AS total, SUM(type = 'pump'), SUM(type = 'dump') FROM signals INDEXED BY idx_signals_chat_kind_ts "
+            "WHERE chat_id = ? AND kind = 'signal' AND ts >= ? GROUP BY symbol ORDER BY total DESC LIMIT ?",
+            (str(chat_id), since, limit),
+        )
+
+def open_store(path=DB_PATH):
+    global store
+    store = SignalHistory(path)
+    return store
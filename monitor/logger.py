@@ -1,5 +1,5 @@
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler
 import sys
 import io
 
@@ -7,8 +7,9 @@ import io
 logger = logging.getLogger("TradingBot")
 logger.setLevel(logging.INFO)
 
-# Ротация логов: максимум 5 МБ, хранить 5 файлов
-handler = RotatingFileHandler("bot.log", maxBytes=5_000_000, backupCount=5, encoding='utf-8')
+# Ротация логов: максимум 5 МБ, хранить 5 файлов.
+# delay=True: файл открывается при первой записи, процессы-воркеры его не открывают вовсе (см. log_to_queue)
+handler = RotatingFileHandler("bot.log", maxBytes=5_000_000, backupCount=5, encoding='utf-8', delay=True)
 formatter = logging.Formatter("[%(asctime)s] %(levelname)s: %(message)s")
 handler.setFormatter(formatter)
 logger.addHandler(handler)
@@ -19,6 +20,16 @@ console_handler.setFormatter(formatter)
 console_handler.setLevel(logging.INFO)
 logger.addHandler(console_handler)
 
+def log_to_queue(log_queue):
+    """
+    Для процессов-воркеров: записи уходят в очередь координатора, который пишет их в bot.log.
+    Иначе несколько процессов ротируют один файл (на Windows ротация падает с PermissionError).
+    """
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+        existing.close()
+    logger.addHandler(QueueHandler(log_queue))
+
 def log(msg, level="info"):
     """Логирование сообщений с указанным уровнем"""
     if level == "error":
@@ -0,0 +1,127 @@
+import asyncio
+from monitor.logger import log
+
+class Stage:
+    """
+    Стадия конвейера: handler(item) -> следующий элемент (или None, чтобы отбросить).
+    workers - число параллельных обработчиков, queue_size - размер входной очереди.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=100):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self._depth_sum = 0
+        self._samples = 0
+
+    def sample(self):
+        depth = self.queue.qsize()
+        self.max_depth = max(self.max_depth, depth)
+        self._depth_sum += depth
+        self._samples += 1
+
+    def stats(self):
+        return {
+            'depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'avg_depth': self._depth_sum / self._samples if self._samples else 0.0,
+            'queue_size': self.queue.maxsize,
+            'workers': self.workers,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'busy': self.busy,
+        }
+
+class Pipeline:
+    """
+    Конвейер из стадий с ограниченными очередями между ними.
+    Полная очередь блокирует предыдущую стадию (backpressure), цикл обрывается по дедлайну.
+    """
+
+    def __init__(self, stages, deadline=55, sample_interval=0.5):
+        self.stages = stages
+        self.deadline = deadline
+        self.sample_interval = sample_interval
+        self.timed_out = False
+
+    def depths(self):
+        """Текущая глубина очереди каждой стадии: {name: qsize}"""
+        return {stage.name: stage.queue.qsize() for stage in self.stages}
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    async def _worker(self, index):
+        stage = self.stages[index]
+        next_queue = self.stages[index + 1].queue if index + 1 < len(self.stages) else None
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await stage.queue.get()
+            started = loop.time()
+            try:
+                result = await stage.handler(item)
+                stage.busy += loop.time() - started
+                stage.processed += 1
+                if result is None:
+                    stage.dropped += 1
+                elif next_queue is not None:
+                    await next_queue.put(result)
+            except Exception as e:
+                stage.errors += 1
+                log(f"Ошибка на стадии {stage.name}: {str(e)}", level="error")
+            finally:
+                stage.queue.task_done()
+
+    async def _sampler(self):
+        while True:
+            for stage in self.stages:
+                stage.sample()
+            await asyncio.sleep(self.sample_interval)
+
+    async def _feed(self, items):
+        first = self.stages[0].queue
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                await first.put(item)
+        else:
+            for item in items:
+                await first.put(item)
+
+    async def _drain(self, items):
+        await self._feed(items)
+        # Стадии завершаются по порядку: очередь пуста и все её элементы обработаны
+        for stage in self.stages:
+            await stage.queue.join()
+
+    async def run(self, items):
+        """Прогоняет items (iterable или async iterable) через все стадии, возвращает stats()"""
+        tasks = [asyncio.create_task(self._sampler())]
+        for index, stage in enumerate(self.stages):
+            tasks.extend(asyncio.create_task(self._worker(index)) for _ in range(stage.workers))
+        try:
+            await asyncio.wait_for(self._drain(items), timeout=self.deadline)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            log(f"Дедлайн цикла {self.deadline} сек: конвейер остановлен, очереди: {self.depths()}", level="warning")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.stats()
+
+    def summary(self):
+        """Строка для лога: загрузка и глубина очередей по стадиям"""
+        parts = []
+        for name, st in self.stats().items():
+            parts.append(
+                f"{name}[{st['workers']}]: обработано {st['processed']}, отброшено {st['dropped']}, ошибок {st['errors']}, "
+                f"очередь max {st['max_depth']}/{st['queue_size']} avg {st['avg_depth']:.1f}, занято {st['busy']:.2f} сек"
+            )
+        return "; ".join(parts)
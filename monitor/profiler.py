@@ -0,0 +1,114 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import time
+from collections import Counter
+import telegram
+from monitor.logger import log
+
+session = None  # ProfileSession, пока идёт профилирование; None - профилирование выключено
+
+class ProfileSession:
+    """
+    Профилирование следующих N циклов run_monitor: cProfile + задержка event loop + число asyncio-задач.
+    Результат (топ функций и .prof-файл) отправляется в чат, запросивший /profile.
+    """
+
+    def __init__(self, cycles, chat_id, token, lag_interval=0.05):
+        self.cycles = cycles
+        self.chat_id = chat_id
+        self.token = token
+        self.lag_interval = lag_interval
+        self.profile = cProfile.Profile()
+        self.done = 0
+        self.durations = []
+        self.lags = []
+        self.max_tasks = 0
+        self.peak_tasks = Counter()
+
+    async def _sample_loop(self):
+        """Задержка event loop: насколько позже запланированного просыпается sleep"""
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+            tasks = asyncio.all_tasks()
+            if len(tasks) > self.max_tasks:
+                self.max_tasks = len(tasks)
+                self.peak_tasks = Counter(_task_name(task) for task in tasks)
+
+    async def run(self, cycle):
+        """Выполняет один цикл под профайлером; после последнего цикла отправляет отчёт"""
+        global session
+        sampler = asyncio.create_task(self._sample_loop())
+        started = time.perf_counter()
+        self.profile.enable()
+        try:
+            await cycle()
+        finally:
+            self.profile.disable()
+            self.durations.append(time.perf_counter() - started)
+            sampler.cancel()
+            await asyncio.gather(sampler, return_exceptions=True)
+            self.done += 1
+        if self.done >= self.cycles:
+            session = None
+            await self.report()
+
+    def summary(self, limit=15):
+        # cumulative показывает, какие этапы цикла долгие; tottime - где именно тратится CPU
+        sections = []
+        for key, title in (('cumulative', 'по cumtime'), ('tottime', 'по tottime')):
+            stream = io.StringIO()
+            pstats.Stats(self.profile, stream=stream).sort_stats(key).print_stats(limit)
+            sections.append(f"Топ {limit} {title}:\n{_trim_stats(stream.getvalue())}")
+        lags = sorted(self.lags)
+        p99_lag = lags[min(len(lags) - 1, int(0.99 * len(lags)))] if lags else 0.0
+        header = (
+            f"Профиль {self.done} циклов: {', '.join(f'{d:.2f}' for d in self.durations)} сек\n"
+            f"Задержка event loop: max {max(lags, default=0.0) * 1000:.0f} мс, p99 {p99_lag * 1000:.0f} мс\n"
+            f"asyncio-задач в пике: {self.max_tasks} ({', '.join(f'{name}: {n}' for name, n in self.peak_tasks.most_common(5))})\n"
+            f"(расчёт индикаторов и графики идут в потоках и в cProfile не попадают)\n\n"
+        )
+        return header + "\n\n".join(sections)
+
+    async def report(self):
+        text = self.summary()
+        log(text, level="info")
+        fd, path = tempfile.mkstemp(prefix='monitor-', suffix='.prof')
+        os.close(fd)
+        try:
+            self.profile.dump_stats(path)
+            bot = telegram.Bot(token=self.token)
+            # Лимит сообщения Telegram - 4096 символов, полный профиль - в файле
+            await bot.send_message(chat_id=self.chat_id, text=text[:4000])
+            with open(path, 'rb') as f:
+                await bot.send_document(chat_id=self.chat_id, document=f, filename=f"profile-{int(time.time())}.prof",
+                                        caption="Открыть: python -m pstats <файл> или snakeviz")
+        except Exception as e:
+            log(f"Ошибка отправки профиля в {self.chat_id}: {e}", level="error")
+        finally:
+            os.remove(path)
+
+def _task_name(task):
+    coro = task.get_coro()
+    return getattr(coro, '__qualname__', None) or task.get_name()
+
+def _trim_stats(text):
+    """Убирает из вывода pstats заголовок с путём и пустые строки"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    start = next((i for i, line in enumerate(lines) if 'ncalls' in line), 0)
+    return "\n".join(lines[start:])
+
+def request(cycles, chat_id, token):
+    """Включает профилирование следующих cycles циклов. False, если профилирование уже идёт."""
+    global session
+    if session is not None:
+        return False
+    session = ProfileSession(cycles, chat_id, token)
+    log(f"Профилирование {cycles} циклов запрошено из {chat_id}", level="info")
+    return True
@@ -0,0 +1,162 @@
+import asyncio
+import bisect
+import json
+import struct
+import time
+import zlib
+import aiohttp
+from monitor.logger import log
+
+# Запись индекса: ts (double), смещение кадра, длина кадра, тип, ключ (symbol:interval)
+INDEX_RECORD = struct.Struct('<dQIB32s')
+KINDS = {'cycle': 0, 'tickers': 1, 'kline': 2}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+# Кадр ответа: {"status": HTTP-код | "timeout" | "error", "latency": сек, "body": JSON, текст ответа или ошибки}
+FRAME_KEYS = {'status', 'latency', 'body'}
+
+def record_key(kind, params):
+    """Ключ записи: symbol:interval для свечей, пусто для тикеров и меток цикла"""
+    if kind == 'kline':
+        return f"{params.get('symbol', '')}:{params.get('interval', '')}"
+    return ''
+
+class Recorder:
+    """
+    Запись сырых ответов биржи в append-only файл.
+    Каждый кадр сжат отдельно (zlib), поэтому по индексу <path>.idx можно читать любой кадр без распаковки остальных.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = open(path, 'ab')
+        self._index = open(path + '.idx', 'ab')
+        self.records = 0
+
+    def record(self, kind, key, body, ts=None, status=200, latency=0.0):
+        """Пишет кадр: ответ с любым статусом, таймаут или ошибку соединения вместе с задержкой"""
+        ts = time.time() if ts is None else ts
+        if kind != 'cycle':
+            body = {'status': status, 'latency': round(latency, 4), 'body': body}
+        frame = zlib.compress(json.dumps(body, separators=(',', ':')).encode('utf-8'))
+        offset = self._data.tell()
+        self._data.write(frame)
+        self._index.write(INDEX_RECORD.pack(ts, offset, len(frame), KINDS[kind], key.encode('utf-8')[:32]))
+        self.records += 1
+
+    def mark_cycle(self):
+        """Метка начала цикла run_monitor: по ним replay делит запись на циклы"""
+        self.record('cycle', '', None)
+        self.flush()
+
+    def flush(self):
+        self._data.flush()
+        self._index.flush()
+
+    def close(self):
+        self.flush()
+        self._data.close()
+        self._index.close()
+        log(f"Запись {self.path} закрыта, кадров: {self.records}", level="info")
+
+def read_index(path):
+    """Читает индекс записи: список (ts, offset, length, kind, key)"""
+    entries = []
+    with open(path + '.idx', 'rb') as f:
+        data = f.read()
+    usable = len(data) - len(data) % INDEX_RECORD.size  # хвост недописанной записи отбрасывается
+    for ts, offset, length, kind, key in INDEX_RECORD.iter_unpack(data[:usable]):
+        entries.append((ts, offset, length, KIND_NAMES[kind], key.rstrip(b'\0').decode('utf-8')))
+    return entries
+
+class ReplaySource:
+    """
+    Источник данных из записи вместо Bybit.
+    speed=1 - реальный темп записи, speed=N - в N раз быстрее, speed=0 - максимально быстро.
+    Ответы по ключу, записанные в цикле, отдаются по порядку (ошибка, повтор, успех - как было);
+    если в цикле запросов по ключу не было - последний более ранний ответ.
+    latency=True - каждый ответ отдаётся с записанной задержкой (делённой на speed).
+    """
+
+    def __init__(self, path, speed=1.0, latency=False):
+        self.path = path
+        self.speed = speed
+        self.latency = latency
+        self._cursor = {}
+        self._data = open(path, 'rb')
+        self._by_key = {}
+        self.cycles = []
+        for ts, offset, length, kind, key in read_index(path):
+            if kind == 'cycle':
+                self.cycles.append(ts)
+            else:
+                self._by_key.setdefault((kind, key), ([], []))
+                stamps, frames = self._by_key[(kind, key)]
+                stamps.append(ts)
+                frames.append((offset, length))
+        self.position = -1
+        self._started = None
+        log(f"Replay {path}: циклов {len(self.cycles)}, ключей {len(self._by_key)}, скорость {speed or 'max'}", level="info")
+
+    @property
+    def cycle_end(self):
+        """Граница текущего цикла: начало следующего (или бесконечность для последнего)"""
+        if self.position + 1 < len(self.cycles):
+            return self.cycles[self.position + 1]
+        return float('inf')
+
+    def clock(self):
+        """Время записи, соответствующее текущему циклу"""
+        if self.position < 0 or not self.cycles:
+            return 0.0
+        return self.cycles[self.position]
+
+    async def advance(self):
+        """Переходит к следующему циклу записи (с паузой по speed). False, если запись закончилась."""
+        if self.position + 1 >= len(self.cycles):
+            return False
+        self.position += 1
+        self._cursor.clear()
+        loop = asyncio.get_running_loop()
+        if self._started is None:
+            self._started = loop.time()
+        elif self.speed:
+            target = self._started + (self.cycles[self.position] - self.cycles[0]) / self.speed
+            await asyncio.sleep(max(0.0, target - loop.time()))
+        return True
+
+    async def response(self, kind, params):
+        """
+        Ответ (status, body) на запрос kind с params, как его вернул бы _request_json.
+        Записанные таймаут и ошибка соединения поднимают те же исключения.
+        """
+        key = (kind, record_key(kind, params))
+        entry = self._by_key.get(key)
+        if entry is None:
+            return 404, f"нет записи для {kind} {params}"
+        stamps, frames = entry
+        start = bisect.bisect_left(stamps, self.clock())
+        end = bisect.bisect_left(stamps, self.cycle_end)
+        if end == 0:
+            return 404, f"нет записи для {kind} {params} до {self.cycle_end}"
+        if start < end:
+            used = self._cursor.get(key, 0)
+            self._cursor[key] = used + 1
+            idx = min(start + used, end - 1)
+        else:
+            idx = end - 1
+        offset, length = frames[idx]
+        self._data.seek(offset)
+        frame = json.loads(zlib.decompress(self._data.read(length)))
+        if not (isinstance(frame, dict) and frame.keys() == FRAME_KEYS):
+            # Запись старого формата: только тела успешных ответов
+            frame = {'status': 200, 'latency': 0.0, 'body': frame}
+        if self.latency and frame['latency']:
+            await asyncio.sleep(frame['latency'] / self.speed if self.speed else frame['latency'])
+        if frame['status'] == 'timeout':
+            raise asyncio.TimeoutError()
+        if frame['status'] == 'error':
+            raise aiohttp.ClientError(frame['body'])
+        return frame['status'], frame['body']
+
+    def close(self):
+        self._data.close()
@@ -30,7 +30,11 @@ def load_config():
                     "obv": True
                 },
                 "min_indicators": 1,
-                "required_indicators": []
+                "required_indicators": [],
+                "workers": 0,
+                "admin_ids": [],
+                "history_db": "signals.db",
+                "candle_dtype": "float64"
             }
             save_config(default_config)
             return default_config
@@ -0,0 +1,307 @@
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+import threading
+from collections import Counter
+import numpy as np
+from monitor.logger import log, log_to_queue, logger
+
+class HashRing:
+    """
+    Консистентное хеширование символов по воркерам.
+    При удалении воркера на другие воркеры переезжают только его символы.
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        self.replicas = replicas
+        self._keys = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def add(self, node):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            bisect.insort(self._keys, h)
+            self._nodes[h] = node
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            self._keys.remove(h)
+            del self._nodes[h]
+
+    def node_for(self, key):
+        if not self._keys:
+            raise LookupError("Нет доступных воркеров")
+        idx = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[self._keys[idx]]
+
+    def assign(self, items, key=str):
+        """Распределяет элементы по узлам: {node: [item, ...]}"""
+        shards = {}
+        for item in items:
+            shards.setdefault(self.node_for(key(item)), []).append(item)
+        return shards
+
+class _Outbox:
+    """
+    Канал воркер -> координатор: результаты и записи логов.
+    У каждого воркера своя труба: убитый посреди записи воркер не держит общий lock очереди,
+    а координатор получает EOFError вместо вечного ожидания недописанного сообщения.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()
+
+    def put(self, message):
+        with self._lock:
+            self.conn.send(message)
+
+    def put_nowait(self, record):
+        # Интерфейс очереди для logging.handlers.QueueHandler
+        self.put(('log', record))
+
+def _worker_main(worker_id, tasks, conn, concurrency):
+    """Точка входа процесса-воркера: fetch + расчёт индикаторов для своего шарда"""
+    outbox = _Outbox(conn)
+    log_to_queue(outbox)
+    from monitor.fetcher import fetch_ohlcv_bybit, configure_fetch, reset_fetch_stats, fetch_summary, close_session
+    from monitor.analyzer import compute_indicators
+
+    async def run_jobs(cycle_id, jobs, group_indicators, fetch_settings, dtype):
+        # Как в цикле бота: настройки и пороги breaker из config['fetch'], счётчики - на одну пачку
+        configure_fetch(fetch_settings)
+        reset_fetch_stats()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_job(symbol, timeframe):
+            async with semaphore:
+                try:
+                    candles = await fetch_ohlcv_bybit(symbol, timeframe, dtype=dtype)
+                    values = None
+                    if not candles.empty:
+                        values = compute_indicators(candles, group_indicators[timeframe], symbol=symbol)
+                    outbox.put(('result', worker_id, cycle_id, symbol, timeframe, candles, values))
+                except Exception as e:
+                    log(f"[worker {worker_id}] Ошибка обработки {symbol}: {e}", level="error")
+                    outbox.put(('result', worker_id, cycle_id, symbol, timeframe, None, None))
+
+        await asyncio.gather(*(run_job(symbol, timeframe) for symbol, timeframe in jobs))
+        outbox.put(('stats', worker_id, cycle_id, len(jobs), fetch_summary()))
+
+    log(f"Воркер {worker_id} запущен", level="info")
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            loop.run_until_complete(run_jobs(*task))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(close_session())
+        loop.close()
+        conn.close()
+
+class Coordinator:
+    """
+    Координатор: раздаёт символы воркерам через консистентное хеширование и собирает
+    результаты (Candles + значения индикаторов) по трубе от каждого воркера.
+    Упавший воркер убирается из кольца, его символы переезжают к живым,
+    а вместо него поднимается новый процесс. Логи воркеров пишет в bot.log только координатор.
+    """
+
+    # Как часто проверять живость воркеров, даже если результаты идут без пауз
+    REAP_INTERVAL = 1.0
+
+    def __init__(self, workers, concurrency=25):
+        self.size = workers
+        self.concurrency = concurrency
+        self._ctx = multiprocessing.get_context('spawn')
+        self._workers = {}  # {worker_id: (process, tasks_queue, results_conn)}
+        self._next_id = 0
+        self._cycle = 0
+        self._batches = Counter()  # {(worker_id, cycle_id): пачек без полученной сводки запросов}
+        self.ring = HashRing()
+
+    def start(self):
+        spawned = 0
+        while len(self._workers) < self.size:
+            self._spawn()
+            spawned += 1
+        if spawned:
+            log(f"Координатор: запущено воркеров {spawned}, всего {len(self._workers)}", level="info")
+
+    def stop(self):
+        for process, tasks, _ in self._workers.values():
+            tasks.put(None)
+        for process, _, conn in self._workers.values():
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self._workers.clear()
+        log("Координатор остановлен", level="info")
+
+    def _spawn(self):
+        worker_id = f"w{self._next_id}"
+        self._next_id += 1
+        tasks = self._ctx.Queue()
+        reader, writer = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, tasks, writer, self.concurrency),
+            name=f"monitor-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        # Пишущий конец остаётся только у воркера: после его смерти чтение даст EOFError
+        writer.close()
+        self._workers[worker_id] = (process, tasks, reader)
+        self.ring.add(worker_id)
+        return worker_id
+
+    def _reap(self):
+        """Убирает умершие воркеры из кольца, возвращает их id"""
+        dead = [wid for wid, (process, _, _) in self._workers.items() if not process.is_alive()]
+        for worker_id in dead:
+            process, _, conn = self._workers.pop(worker_id)
+            conn.close()
+            for batch in [batch for batch in self._batches if batch[0] == worker_id]:
+                del self._batches[batch]
+            self.ring.remove(worker_id)
+            log(f"Воркер {worker_id} завершился (код {process.exitcode}), его символы перераспределены", level="warning")
+        return dead
+
+    def _receive(self, timeout):
+        """Ждёт сообщений от воркеров до timeout секунд; записи логов сразу передаёт в logger"""
+        conns = {conn: wid for wid, (_, _, conn) in self._workers.items() if not conn.closed}
+        messages = []
+        for conn in multiprocessing.connection.wait(list(conns), timeout):
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                # Воркер умер; из кольца его уберёт _reap
+                conn.close()
+                continue
+            if message[0] == 'log':
+                logger.handle(message[1])
+            elif message[0] == 'stats':
+                _, worker_id, cycle_id, jobs, summary = message
+                self._batches[(worker_id, cycle_id)] -= 1
+                log(f"Запросы свечей [{worker_id}, цикл {cycle_id}, заданий {jobs}]: {summary}", level="info")
+            else:
+                messages.append(message)
+        return messages
+
+    def _dispatch(self, cycle_id, jobs, group_indicators, fetch_settings, dtype):
+        """Раздаёт задания по кольцу (все таймфреймы символа - одному воркеру), возвращает {worker_id: set(jobs)}"""
+        pending = {}
+        for worker_id, shard in self.ring.assign(jobs, key=lambda job: job[0]).items():
+            self._workers[worker_id][1].put((cycle_id, shard, group_indicators, fetch_settings, dtype))
+            self._batches[(worker_id, cycle_id)] += 1
+            pending[worker_id] = set(shard)
+        return pending
+
+    def _rebalance(self, cycle_id, pending, group_indicators, fetch_settings, dtype):
+        """Переотдаёт незавершённые задания умерших воркеров живым"""
+        dead = self._reap()
+        orphaned = [job for wid in dead for job in pending.pop(wid, ())]
+        if orphaned and self._workers:
+            for worker_id, shard in self._dispatch(cycle_id, orphaned, group_indicators, fetch_settings, dtype).items():
+                pending.setdefault(worker_id, set()).update(shard)
+        elif orphaned:
+            log(f"Цикл {cycle_id}: нет живых воркеров, потеряно {len(orphaned)} заданий", level="error")
+
+    async def run_cycle(self, symbols, group_indicators, timeout=55, fetch_settings=None, dtype=np.float64):
+        """
+        Асинхронный генератор результатов цикла: (symbol, timeframe, candles, values).
+        group_indicators - {timeframe: индикаторы для расчёта}, fetch_settings - config['fetch'],
+        dtype - тип массивов свечей (config['candle_dtype']).
+        """
+        self._reap()
+        self.start()
+        self._cycle += 1
+        cycle_id = self._cycle
+        self._batches.clear()
+        jobs = [(symbol, timeframe) for timeframe in group_indicators for symbol in symbols]
+        pending = self._dispatch(cycle_id, jobs, group_indicators, fetch_settings, dtype)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        next_reap = loop.time() + self.REAP_INTERVAL
+
+        while any(pending.values()):
+            if loop.time() > deadline:
+                left = sum(len(p) for p in pending.values())
+                log(f"Цикл {cycle_id}: таймаут, не получено {left} результатов от воркеров", level="warning")
+                break
+            # Проверка по таймеру: живые воркеры могут слать результаты без пауз
+            if loop.time() >= next_reap:
+                self._rebalance(cycle_id, pending, group_indicators, fetch_settings, dtype)
+                next_reap = loop.time() + self.REAP_INTERVAL
+            messages = await loop.run_in_executor(None, self._receive, 0.5)
+            for _, worker_id, msg_cycle, symbol, timeframe, candles, values in messages:
+                if msg_cycle != cycle_id:
+                    continue
+                pending.get(worker_id, set()).discard((symbol, timeframe))
+                if candles is None or values is None:
+                    continue
+                yield symbol, timeframe, candles, values
+
+        # Сводка запросов приходит сразу после последнего результата пачки - дожидаемся её, чтобы она попала в лог этого цикла
+        stats_deadline = loop.time() + 1.0
+        while any(count > 0 for count in self._batches.values()) and loop.time() < stats_deadline:
+            await loop.run_in_executor(None, self._receive, 0.2)
+
+async def _self_check(workers, symbols):
+    """Проверка на localhost: перенос ключей при удалении узла и ребалансировка после убийства воркера"""
+    import os
+    import socket
+    from aiohttp import web
+    from monitor.analyzer import DEFAULT_INDICATORS
+    from monitor.fake_exchange import make_app
+
+    names = [f"FAKE{i}USDT" for i in range(symbols)]
+    ring = HashRing([f"w{i}" for i in range(workers)])
+    before = {name: ring.node_for(name) for name in names}
+    ring.remove("w0")
+    moved = [name for name in names if ring.node_for(name) != before[name]]
+    assert all(before[name] == "w0" for name in moved), "переехали символы живых узлов"
+    log(f"HashRing: при удалении w0 переехало {len(moved)} из {len(names)} символов, все - с w0", level="info")
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    runner = web.AppRunner(make_app(symbols=symbols, latency=0.2, seed=1))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    # Воркеры запускаются через spawn и читают BYBIT_API при импорте fetcher
+    os.environ['BYBIT_API'] = f"http://127.0.0.1:{port}/v5/market"
+    coordinator = Coordinator(workers, concurrency=5)
+    coordinator.start()
+    try:
+        received = set()
+        async for symbol, timeframe, candles, values in coordinator.run_cycle(names, {'1m': DEFAULT_INDICATORS}, timeout=60):
+            received.add(symbol)
+            if len(received) == symbols // 4:
+                process, _, _ = coordinator._workers["w0"]
+                process.kill()
+                log("Воркер w0 убит посреди цикла", level="warning")
+        assert received == set(names), f"получено {len(received)} из {symbols}"
+        log(f"Ребалансировка: получены результаты по всем {symbols} символам", level="info")
+    finally:
+        coordinator.stop()
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    # python -m monitor.sharding - самопроверка на фейковой бирже
+    asyncio.run(_self_check(workers=3, symbols=80))
@@ -1,14 +1,26 @@
 # signals.py (полностью измененный код)
+import asyncio
 import telegram
 from monitor.logger import log
-from monitor.charts import create_chart
 
-async def send_signal(symbol, df, info, config):
+dry_run = False  # True: сообщения только логируются (bot.py --dry-run / --replay)
+
+def render_chart(candles, symbol, timeframe):
+    """Рисует график; matplotlib/mplfinance импортируются при первом вызове (в потоке, не в event loop)"""
+    from monitor.charts import create_chart
+    return create_chart(candles, symbol, timeframe)
+
+async def send_signal(symbol, candles, info, config, chart_cache=None):
+    """
+    Отправляет сигнал в чат config['chat_id'].
+    chart_cache - общий словарь {timeframe: png} для подписчиков одного символа,
+    чтобы график рисовался один раз, а не для каждого чата.
+    """
     try:
         log(f"Начало отправки сигнала для {symbol}")
         bot = telegram.Bot(token=config['telegram_token'])
-        last_close = float(df['close'].iloc[-1])
-        prev_close = float(df['close'].iloc[-2])
+        last_close = float(candles.close[-1])
+        prev_close = float(candles.close[-2])
         tf_change = (last_close - prev_close) / prev_close * 100 if prev_close != 0 else 0
 
         signal_type = info.get("type", "")
@@ -60,7 +72,16 @@ async def send_signal(symbol, df, info, config):
             f"<a href=\"{tradingview_url}\">Открыть график на TradingView</a>"
         )
 
-        chart_buf = create_chart(df, symbol, config['timeframe'])
+        if chart_cache is None:
+            chart_cache = {}
+        if config['timeframe'] not in chart_cache:
+            # Рисуем в потоке, чтобы не блокировать остальные стадии конвейера
+            chart_buf = await asyncio.to_thread(render_chart, candles, symbol, config['timeframe'])
+            chart_cache[config['timeframe']] = chart_buf.getvalue() if chart_buf is not None else None
+        chart_buf = chart_cache[config['timeframe']]
+        if dry_run:
+            log(f"[dry-run] Сигнал для {config['chat_id']}: {symbol} {label} | {tf_change:.2f}% | график {'есть' if chart_buf else 'нет'}")
+            return
         log(f"Отправка сообщения в чат {config['chat_id']}...")
         if chart_buf is None:
             log(f"График не создан для {symbol}", level="warning")
@@ -0,0 +1,39 @@
+import importlib
+import threading
+import time
+
+# Импортируется первым в bot.py, поэтому отсчёт идёт почти от запуска процесса
+_started = time.perf_counter()
+_marks = []
+
+def mark(stage):
+    """Отмечает завершение этапа запуска"""
+    _marks.append((stage, time.perf_counter()))
+
+def report():
+    """Пишет в лог разбивку времени запуска по этапам"""
+    from monitor.logger import log
+
+    parts = []
+    previous = _started
+    for stage, moment in _marks:
+        parts.append(f"{stage} +{moment - previous:.2f} (с запуска {moment - _started:.2f})")
+        previous = moment
+    log(f"Время запуска: {'; '.join(parts)}", level="info")
+
+def prewarm(modules):
+    """Импортирует тяжёлые модули (TA-Lib, графики) в фоновом потоке, пока бот уже работает"""
+    def worker():
+        from monitor.logger import log
+
+        for name in modules:
+            started = time.perf_counter()
+            try:
+                importlib.import_module(name)
+                log(f"Прогрет модуль {name} за {time.perf_counter() - started:.2f} сек", level="info")
+            except Exception as e:
+                log(f"Ошибка прогрева модуля {name}: {e}", level="error")
+
+    thread = threading.Thread(target=worker, name="prewarm", daemon=True)
+    thread.start()
+    return thread
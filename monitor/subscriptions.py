@@ -0,0 +1,83 @@
+import copy
+from monitor.logger import log
+from monitor.settings import load_config, save_config
+
+# Настройки, которые у каждого подписчика свои. Остальное (токен, фильтр объёма) - общее.
+SUBSCRIBER_KEYS = (
+    'bot_status',
+    'timeframe',
+    'price_change_threshold',
+    'indicators_enabled',
+    'min_indicators',
+    'required_indicators',
+)
+
+def is_main_chat(config, chat_id):
+    """Основной чат хранит свои настройки на верхнем уровне config.json (как раньше)"""
+    return str(chat_id) == str(config.get('chat_id', ''))
+
+def is_admin(config, user_id):
+    """Пользователь из config['admin_ids']; id в JSON могут быть записаны и числом, и строкой"""
+    return str(user_id) in {str(admin_id) for admin_id in config.get('admin_ids', [])}
+
+def is_registered(config, chat_id):
+    """Чат уже получает рассылку: основной chat_id или запись в config['subscribers']"""
+    return is_main_chat(config, chat_id) or str(chat_id) in config.get('subscribers', {})
+
+def subscriber_config(config, chat_id):
+    """
+    Эффективная конфигурация подписчика: общие настройки + его переопределения.
+    Незарегистрированный чат получает общие настройки с выключенным bot_status.
+    """
+    chat_id = str(chat_id)
+    sub = {k: v for k, v in config.items() if k != 'subscribers'}
+    if not is_main_chat(config, chat_id):
+        overrides = config.get('subscribers', {}).get(chat_id)
+        if overrides is None:
+            sub['bot_status'] = False
+        else:
+            sub.update(overrides)
+    sub['chat_id'] = chat_id
+    return copy.deepcopy(sub)
+
+def get_subscribers(config):
+    """Список конфигураций всех подписчиков: основной chat_id + config['subscribers']"""
+    subscribers = []
+    if config.get('chat_id'):
+        subscribers.append(subscriber_config(config, config['chat_id']))
+    for chat_id in config.get('subscribers', {}):
+        if not is_main_chat(config, chat_id):
+            subscribers.append(subscriber_config(config, chat_id))
+    return subscribers
+
+def group_by_timeframe(subscribers):
+    """Группирует подписчиков по таймфрейму: {timeframe: [sub_config, ...]}"""
+    groups = {}
+    for sub in subscribers:
+        groups.setdefault(sub['timeframe'], []).append(sub)
+    return groups
+
+def update_subscriber(chat_id, key, value):
+    """Обновляет настройку подписчика (создаёт его при первом изменении) и сохраняет config.json"""
+    return update_subscriber_many(chat_id, {key: value})
+
+def update_subscriber_many(chat_id, values):
+    """Обновляет несколько настроек подписчика одной записью config.json"""
+    chat_id = str(chat_id)
+    config = load_config()
+    if is_main_chat(config, chat_id):
+        target = config
+    else:
+        subscribers = config.setdefault('subscribers', {})
+        if chat_id not in subscribers:
+            subscribers[chat_id] = {k: copy.deepcopy(config[k]) for k in SUBSCRIBER_KEYS if k in config}
+            subscribers[chat_id]['bot_status'] = False
+            log(f"Новый подписчик: {chat_id}", level="info")
+        target = subscribers[chat_id]
+    for key, value in values.items():
+        if key not in SUBSCRIBER_KEYS:
+            raise ValueError(f"Настройка {key} не относится к подписчику")
+        target[key] = value
+    save_config(config)
+    log(f"Настройки подписчика {chat_id} обновлены: {values}", level="info")
+    return subscriber_config(config, chat_id)